@@ -0,0 +1,49 @@
+import pandas as pd
+
+
+class TransactionAggregates:
+    """
+    Daily and monthly aggregates of the transaction table, shared by the maintenance and ATM checks.
+
+    update() is called with each batch of rows as it is ingested, so the aggregates are
+    complete as soon as the table is, without another pass over it.
+    """
+
+    def __init__(self, debit_bit, atm_withdrawal_bit):
+        self.debit_bit = debit_bit
+        self.atm_withdrawal_bit = atm_withdrawal_bit
+        # Sum of non-zero amounts per transaction date, in kobo
+        self.daily_amounts = pd.Series(dtype='Int64')
+        # Debit turnover and "Actual Charge:" amounts in kobo per 'YYYY-MM' month, in order of first appearance
+        self.monthly_debits = pd.DataFrame({'Total Debit': pd.Series(dtype='Int64'),
+                                            'Actual Charge': pd.Series(dtype='Int64')},
+                                           index=pd.Index([], dtype=object))
+        # Position of each dated ATM withdrawal within its month (1 = first), by table row
+        self.atm_sequence = pd.Series(dtype='int64')
+        self._atm_month_counts = pd.Series(dtype='int64')
+
+    def update(self, rows):
+        """
+        Fold a batch of transaction table rows into the aggregates
+        """
+        dated = rows[rows['date'].notna()]
+        if dated.empty:
+            return
+
+        with_amount = dated[dated['amount'] > 0]
+        daily = with_amount.groupby('date')['amount'].sum()
+        self.daily_amounts = self.daily_amounts.add(daily, fill_value=0)
+
+        debits = dated[(dated['tags'] & self.debit_bit) != 0]
+        monthly = pd.DataFrame({
+            'Total Debit': debits['amount'].fillna(0),
+            'Actual Charge': debits['actual_charge'].fillna(0)
+        }).groupby(debits['date'].dt.strftime('%Y-%m'), sort=False).sum()
+        self.monthly_debits = pd.concat([self.monthly_debits, monthly]).groupby(level=0, sort=False).sum()
+
+        withdrawals = dated[(dated['tags'] & self.atm_withdrawal_bit) != 0]
+        months = withdrawals['date'].dt.strftime('%Y-%m')
+        earlier = months.map(self._atm_month_counts).fillna(0).astype('int64')
+        sequence = withdrawals.groupby(months).cumcount() + 1 + earlier
+        self._atm_month_counts = self._atm_month_counts.add(months.value_counts(), fill_value=0).astype('int64')
+        self.atm_sequence = pd.concat([self.atm_sequence, sequence.astype('int64')])
@@ -0,0 +1,1646 @@
+import pandas as pd
+import numpy as np
+import pdfplumber
+from aggregates import TransactionAggregates
+from bank_formats import (BANK_FORMATS, DETECTION_SAMPLE_LINES, column_profiles, detect_bank_format,
+                          registry_fingerprint)
+from fee_rules import FeeSchedule
+from instrumentation import DEBUG_SAMPLE_EVERY, StageTimer, log_stage, logged_stage, timed_iter
+from pdf_tables import HEADER_SEARCH_PAGES, find_column_layout
+import logging
+import re
+import io
+import codecs
+import os
+import math
+import json
+import operator
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+from itertools import chain, repeat
+
+
+logger = logging.getLogger('bank_app.analyzer')
+
+
+# Keywords for every line category the analyzer reports on. A line belongs to each
+# category whose keyword appears anywhere in it (case-insensitive).
+LINE_CATEGORIES = {
+    'otp': ('OTP',),
+    'sms': ('SMS Charges', 'Notification Fee', 'Alert Fee'),
+    'card_issuance': ('Card Issuance Fee', 'Card Replacement', 'Card Renewal'),
+    'forex': ('FX Charges', 'Foreign Exchange Fee', 'Domiciliary Withdrawal Fee'),
+    'bill_payment': ('Bill Payment', 'Utility Charges', 'E-Channel Fee'),
+    'statement_request': ('Statement Fee', 'Account Statement Charge', 'Custom Statement'),
+    'hardware_token': ('Token Fee', 'Hardware Token Charge', 'Token Replacement', 'Interest Charge',
+                       'Loan Fee', 'Restructuring Fee', 'Late Payment Fee'),
+    'eft_nip': ('NIP',),
+    'eft_nip_charge_vat': ('NIP Charge + VAT', 'NIP Charge', 'NIP Transfer Charge'),
+    'eft_trf': ('TRF',),
+    'eft_tra': ('Tra',),
+    'eft_trf_charge': ('TRF Charge', 'Transfer Charge'),
+    'eft_vat': ('VAT on',),
+    'stamp_duty': ('STAMP DUTY CHARGE',),
+    'self_transfer': ('self-to-self',),
+    'debit': ('debit',),
+    'atm_withdrawal': ('ATM Withdrawal',),
+    'account_maintenance': ('ACCOUNT MAINTENANCE FEE',),
+}
+
+# Field patterns used when parsing statement lines into the transaction table; dates are
+# found by the bank formats in bank_formats
+AMOUNT_PATTERN = r'([\d,]+\.\d{2})'
+CHARGE_PATTERN = r'Charge: ([\d,]+\.\d{2})'
+ACTUAL_CHARGE_PATTERN = r'Actual Charge: ([\d,]+\.\d{2})'
+DIRECTION_PATTERN = r'(?i)\b(debit|dr|credit|cr)\b'
+DIRECTIONS = {'debit': 'debit', 'dr': 'debit', 'credit': 'credit', 'cr': 'credit'}
+REFERENCE_PATTERN = r'(?i)\bREF(?:ERENCE)?\b[:.#\s]*([A-Z0-9/-]*\d[A-Z0-9/-]{4,})'
+
+# EFT transaction types in order of precedence, with their line category: a line matching
+# several categories (e.g. "NIP Charge + VAT" is also "NIP") takes the first
+EFT_TYPES = (
+    ('NIP Charge + VAT', 'eft_nip_charge_vat'),
+    ('TRF Charge', 'eft_trf_charge'),
+    ('VAT', 'eft_vat'),
+    ('NIP', 'eft_nip'),
+    ('TRF', 'eft_trf'),
+    ('Tra', 'eft_tra'),
+)
+# EFT types that are charges posted for a transfer rather than transfers
+EFT_CHARGE_TYPES = ('NIP Charge + VAT', 'TRF Charge', 'VAT')
+# Furthest a charge line without a matching reference may be from its transfer
+CHARGE_PAIRING_LINES = 3
+# Days a stamp duty charge may be posted after the credit it is levied on
+STAMP_DUTY_LAG_DAYS = 1
+# Outcome of checking each stamp duty charge, and each credit that should have carried one
+STAMP_DUTY_FINDINGS = pd.CategoricalDtype([
+    'Charged', 'Charged on self-to-self transfer', 'Charged twice', 'No qualifying credit', 'Not charged',
+    'No credits in statement',
+])
+
+# Bump whenever ingestion or parsing changes, so cached documents are re-parsed
+PARSER_VERSION = 6
+
+# Lines parsed per batch while streaming a document into the transaction table
+INGEST_CHUNK_LINES = 10_000
+
+# CSV ingestion: bytes sampled to detect the encoding, rows parsed per chunk, rows kept for preview
+CSV_ENCODINGS = ('utf-8', 'cp1252', 'latin-1')
+ENCODING_SAMPLE_BYTES = 64 * 1024
+CSV_CHUNK_ROWS = 50_000
+CSV_PREVIEW_ROWS = 1_000
+
+# Column-mapping profiles for structured CSV exports, tried in file order
+CSV_PROFILES_PATH = os.environ.get(
+    'BANK_APP_CSV_PROFILES', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'csv_profiles.json'))
+
+# PDFs with fewer pages than this are extracted serially; process start-up costs more than it saves
+PARALLEL_MIN_PAGES = 20
+
+# Rows of a tabular PDF mapped onto the transaction table per batch
+PDF_TABLE_CHUNK_ROWS = 10_000
+
+
+class LineClassifier:
+    """
+    Tag statement lines with every matching category using one combined keyword pattern
+    """
+
+    def __init__(self, categories=LINE_CATEGORIES):
+        self.categories = list(categories)
+        self.bits = {name: 1 << position for position, name in enumerate(self.categories)}
+
+        keyword_masks = {}
+        for name, keywords in categories.items():
+            for keyword in keywords:
+                keyword_masks[keyword.lower()] = keyword_masks.get(keyword.lower(), 0) | self.bits[name]
+
+        # Only one alternative can match at a given position, so a keyword also carries the
+        # categories of every keyword it contains (e.g. "NIP Charge + VAT" is also "NIP").
+        self._masks = {
+            keyword: reduce(operator.or_, (mask for other, mask in keyword_masks.items() if other in keyword), 0)
+            for keyword in keyword_masks
+        }
+
+        # Zero-width lookahead so overlapping keywords on the same line are all reported
+        alternation = '|'.join(re.escape(keyword) for keyword in sorted(keyword_masks, key=len, reverse=True))
+        self._pattern = re.compile(f'(?=({alternation}))', re.IGNORECASE)
+
+    def tag(self, line):
+        """
+        Return the category bitmask for a single line
+        """
+        tags = 0
+        for match in self._pattern.finditer(line):
+            tags |= self._masks[match.group(1).lower()]
+        return tags
+
+    def classify(self, lines):
+        """
+        Walk the lines once and return the category bitmask of each
+        """
+        return [self.tag(line) for line in lines]
+
+
+# Parsed dates by raw date string, kept per format across documents and shared by every
+# thread analyzing one, hence the lock
+DATE_CACHE_LIMIT = 100_000
+_date_cache = {}
+_date_cache_lock = threading.Lock()
+
+
+def parse_date_tokens(tokens, date_format):
+    """
+    Parse a Series of date strings with one to_datetime call for the strings not seen before.
+    Tokens are mapped from a copy of their own dates, which other threads cannot change.
+    """
+    tokens_seen = tokens.dropna().unique()
+    with _date_cache_lock:
+        cache = _date_cache.setdefault(date_format, {})
+        unseen = [token for token in tokens_seen if token not in cache]
+        if unseen and len(cache) + len(unseen) > DATE_CACHE_LIMIT:
+            # Clearing drops this batch's known tokens too, so parse all of them again
+            cache.clear()
+            unseen = list(tokens_seen)
+        if unseen:
+            cache.update(zip(unseen, pd.to_datetime(pd.Series(unseen), format=date_format, errors='coerce')))
+        dates = {token: cache[token] for token in tokens_seen}
+    return pd.to_datetime(tokens.map(dates))
+
+
+def find_statement_dates(descriptions, formats):
+    """
+    Dates of the lines in the first of formats that has one on each line, and that format's name
+    """
+    dates = pd.Series(pd.NaT, index=descriptions.index, dtype='datetime64[ns]')
+    names = pd.Series(None, index=descriptions.index, dtype=object)
+    for candidate in reversed(formats):
+        tokens = candidate.find_dates(descriptions)
+        found = tokens.notna()
+        dates = parse_date_tokens(tokens, candidate.date_format).where(found, dates)
+        names = names.mask(found, candidate.name)
+    return dates, names
+
+
+def parse_statement_dates(descriptions, bank_format=None):
+    """
+    Find and parse the date of every line in one batch.
+
+    Returns the dates and the bank format they were written in. With a detected bank format
+    (see detect_bank_format) only its pattern runs on every line, and the other formats only
+    on lines it found no date on. Otherwise every registered format's pattern runs, and a date
+    in an earlier-registered format (e.g. Access dd-MON-yy) takes precedence over one in a
+    later format (e.g. Zenith dd/mm/yyyy) on the same line.
+    """
+    if bank_format is None:
+        dates, names = find_statement_dates(descriptions, list(BANK_FORMATS.values()))
+    else:
+        dates, names = find_statement_dates(descriptions, [BANK_FORMATS[bank_format]])
+        undated = names.isna()
+        others = [candidate for name, candidate in BANK_FORMATS.items() if name != bank_format]
+        if undated.any() and others:
+            other_dates, other_names = find_statement_dates(descriptions[undated], others)
+            dates = dates.fillna(other_dates)
+            names = names.fillna(other_names)
+    return dates, pd.Categorical(names, categories=list(BANK_FORMATS))
+
+
+def parse_amounts(values):
+    """
+    Convert extracted "1,234.56" strings to kobo (Int64, NA where nothing was found).
+    The patterns always capture two decimals, so dropping the separators leaves the exact kobo.
+    """
+    return pd.to_numeric(values.str.replace(r'[,.]', '', regex=True), errors='coerce').astype('Int64')
+
+
+def format_dates(dates):
+    """
+    Render a datetime Series as dd/mm/yyyy strings, None where the date is missing
+    """
+    return dates.dt.strftime('%d/%m/%Y').astype(object).where(dates.notna(), None)
+
+
+def line_numbers(rows):
+    """
+    1-based statement line numbers of transaction table rows, for the 'Line' column of fee tables
+    """
+    return pd.array(rows.index + 1, dtype='Int64')
+
+
+def build_transaction_table(lines, classifier, start=0, bank_format=None):
+    """
+    Parse statement lines once into the normalized transaction table.
+
+    One row per source line, indexed by line number (counting from start), with the parsed date,
+    first amount, debit/credit direction, bank date format, inline charges and the classifier's
+    category tags. Amounts and charges are in kobo. Dates are read in the named bank format
+    only, if given.
+    """
+    index = pd.RangeIndex(start, start + len(lines), name='line')
+    descriptions = pd.Series(lines, index=index, dtype=object)
+    dates, bank_format = parse_statement_dates(descriptions, bank_format)
+    directions = descriptions.str.extract(DIRECTION_PATTERN, expand=False).str.lower().map(DIRECTIONS)
+
+    table = pd.DataFrame({
+        'date': dates,
+        'amount': parse_amounts(descriptions.str.extract(AMOUNT_PATTERN, expand=False)),
+        'direction': pd.Categorical(directions, categories=['debit', 'credit']),
+        'description': descriptions,
+        'bank_format': bank_format,
+        'charge': parse_amounts(descriptions.str.extract(CHARGE_PATTERN, expand=False)),
+        'actual_charge': parse_amounts(descriptions.str.extract(ACTUAL_CHARGE_PATTERN, expand=False)),
+        'tags': pd.Series(classifier.classify(lines), index=index, dtype='int64'),
+    })
+    return table
+
+
+def read_document_bytes(document):
+    """
+    Return the raw bytes of an uploaded file, open file object or path
+    """
+    if isinstance(document, (str, os.PathLike)):
+        with open(document, 'rb') as file:
+            return file.read()
+    if hasattr(document, 'getvalue'):
+        return document.getvalue()
+    document.seek(0)
+    document_bytes = document.read()
+    document.seek(0)
+    return document_bytes
+
+
+def sniff_encoding(sample):
+    """
+    Return the first of CSV_ENCODINGS that decodes a byte sample.
+    A multi-byte character cut off at the end of the sample is not treated as an error.
+    """
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    for encoding in CSV_ENCODINGS:
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return CSV_ENCODINGS[-1]
+
+
+def csv_row_lines(chunk):
+    """
+    Render each row of a CSV chunk as one statement line, its cell values separated by two spaces
+    """
+    cells = chunk.fillna('')
+    if cells.shape[1] == 1:
+        return cells.iloc[:, 0]
+    return cells.iloc[:, 0].str.cat(cells.iloc[:, 1:], sep='  ')
+
+
+def load_csv_profiles(path=CSV_PROFILES_PATH):
+    """
+    Load CSV column-mapping profiles: {profile: {"date_format": ..., "columns": {field: [headers]}}}
+    """
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def resolve_csv_columns(header, profiles):
+    """
+    Match a CSV header against the profiles.
+
+    Returns the first profile name whose date, description and at least one of the
+    debit/credit/amount columns are present, with its {field: header} mapping,
+    or (None, None) when no profile fits.
+    """
+    headers = {str(name).strip().lower(): name for name in header}
+    for profile_name, profile in profiles.items():
+        columns = {}
+        for field, aliases in profile['columns'].items():
+            found = next((headers[alias.lower()] for alias in aliases if alias.lower() in headers), None)
+            if found is not None:
+                columns[field] = found
+        if {'date', 'description'} <= columns.keys() and {'debit', 'credit', 'amount'} & columns.keys():
+            return profile_name, columns
+    return None, None
+
+
+def column_amounts(chunk, column):
+    """
+    Parse an amount column ("1,234.56", blank when absent) into kobo (Int64)
+    """
+    if column is None:
+        return pd.Series(pd.NA, index=chunk.index, dtype='Int64')
+    naira = pd.to_numeric(chunk[column].str.replace(',', '', regex=False).str.strip(), errors='coerce')
+    return (naira * 100).round().astype('Int64')
+
+
+def build_csv_transaction_table(chunk, columns, classifier, date_format=None, start=0, bank_format=None):
+    """
+    Map a chunk of a structured CSV export straight onto the transaction table.
+
+    columns maps table fields to CSV headers (see resolve_csv_columns). Direction and amount
+    come from the debit/credit columns, or from the sign of a single amount column. Without
+    a date_format, dates are read in the named bank format, if given, as on statement lines.
+    """
+    index = pd.RangeIndex(start, start + len(chunk), name='line')
+    chunk = chunk.set_axis(index)
+    descriptions = chunk[columns['description']].fillna('').astype(object)
+
+    raw_dates = chunk[columns['date']].astype(object)
+    if date_format:
+        dates = parse_date_tokens(raw_dates, date_format)
+        bank_format = pd.Categorical([None] * len(chunk), categories=list(BANK_FORMATS))
+    else:
+        dates, bank_format = parse_statement_dates(raw_dates.fillna(''), bank_format)
+        # Exports commonly use ISO dates (yyyy-mm-dd) rather than the printed statement formats
+        dates = dates.fillna(parse_date_tokens(raw_dates.str.slice(0, 10), '%Y-%m-%d'))
+
+    debit = column_amounts(chunk, columns.get('debit'))
+    credit = column_amounts(chunk, columns.get('credit'))
+    if 'amount' in columns:
+        signed = column_amounts(chunk, columns['amount'])
+        debit = debit.fillna(-signed.where(signed < 0))
+        credit = credit.fillna(signed.where(signed >= 0))
+    is_debit = debit.fillna(0) > 0
+    is_credit = ~is_debit & (credit.fillna(0) > 0)
+
+    tags = pd.Series(classifier.classify(descriptions), index=index, dtype='int64')
+    tags = tags.where(~is_debit, tags | classifier.bits['debit'])
+
+    return pd.DataFrame({
+        'date': dates,
+        'amount': debit.where(is_debit, credit),
+        'direction': pd.Categorical(
+            np.where(is_debit, 'debit', np.where(is_credit, 'credit', None)), categories=['debit', 'credit']),
+        'description': descriptions,
+        'bank_format': bank_format,
+        'charge': parse_amounts(descriptions.str.extract(CHARGE_PATTERN, expand=False)),
+        'actual_charge': parse_amounts(descriptions.str.extract(ACTUAL_CHARGE_PATTERN, expand=False)),
+        'tags': tags,
+    }, index=index)
+
+
+def document_file_type(name):
+    """
+    'pdf' or 'csv' from a file name's extension, None for anything else
+    """
+    name = name.lower()
+    if name.endswith('.pdf'):
+        return 'pdf'
+    if name.endswith('.csv'):
+        return 'csv'
+    return None
+
+
+def ingest_document(name, document_bytes, csv_profiles=None, max_workers=None, pdf_tables=True):
+    """
+    Ingest one document on its own and return (snapshot or None, errors). Runs in a worker process.
+    """
+    analyzer = EFTChargeAnalyzer(max_workers=max_workers, csv_profiles=csv_profiles, pdf_tables=pdf_tables)
+    document = io.BytesIO(document_bytes)
+    document.name = name
+    result = analyzer.process_document(document)
+    return (analyzer.snapshot() if result is not None else None), analyzer.errors
+
+
+def merge_statement_tables(tables):
+    """
+    Merge the transaction tables of several statements of one account into one timeline.
+
+    tables is a list of (source name, table). Statements are ordered by their first date and
+    keep their own line order. A line whose date, amount, direction and text hash the same as
+    a line of an earlier statement, from an overlapping period, is dropped: the n-th such line
+    of a statement only matches an n-th one, so repeated transactions within a statement stay.
+    Only dated lines with an amount are compared; headers, blank rows and other text always stay.
+
+    Returns the merged table, with 'source' and 'source_line' columns, and the number of
+    duplicate lines dropped from each source.
+    """
+    ordered = sorted(tables, key=lambda item: item[1]['date'].min() if item[1]['date'].notna().any()
+                     else pd.Timestamp.max)
+    sources = [name for name, _ in ordered]
+    combined = pd.concat(
+        [table.assign(source=name, source_line=table.index) for name, table in ordered], ignore_index=True)
+    combined['source'] = pd.Categorical(combined['source'], categories=sources)
+
+    hashes = pd.util.hash_pandas_object(
+        combined[['date', 'amount', 'direction']].assign(description=combined['description'].str.strip()),
+        index=False)
+    occurrence = hashes.groupby([combined['source'], hashes], observed=True).cumcount()
+    candidate = combined['date'].notna() & combined['amount'].notna()
+    duplicate = pd.DataFrame({'hash': hashes, 'occurrence': occurrence}).duplicated(keep='first') & candidate
+
+    dropped = combined.loc[duplicate, 'source'].value_counts().reindex(sources, fill_value=0)
+    merged = combined[~duplicate.to_numpy()].reset_index(drop=True)
+    merged.index = pd.RangeIndex(len(merged), name='line')
+    return merged, dropped
+
+
+def join_by(values, keys, separator=', '):
+    """
+    Join string values sharing a key, in order, without a Python call per group:
+    the n-th values of all groups are appended in one step for each n. Values with an NA key are left out.
+    """
+    keyed = keys.notna().to_numpy()
+    values, keys = values[keyed], keys[keyed]
+    nth = values.groupby(keys).cumcount().to_numpy()
+    joined = pd.Series(values[nth == 0].to_numpy(), index=keys[nth == 0].to_numpy(), dtype=object)
+    for n in range(1, nth.max() + 1 if len(nth) else 0):
+        part = pd.Series(values[nth == n].to_numpy(), index=keys[nth == n].to_numpy(), dtype=object)
+        joined[part.index] = joined[part.index] + separator + part
+    return joined
+
+
+def pair_charge_lines(transfers, charges, direction='backward', max_distance=CHARGE_PAIRING_LINES):
+    """
+    Find the transfer each charge line was posted for, by sorted (as-of) joins on line number.
+
+    A charge line carrying a reference is paired with the nearest transfer of the same date and
+    reference. Any other is paired with the nearest transfer of the same date at most
+    max_distance lines before its block of consecutive charge lines (e.g. a charge and its VAT),
+    or after it when direction is 'forward' (statements listed newest first).
+    Returns the transfer's line number per charge line, NA where none was found.
+    """
+    def keys(rows, position):
+        return pd.DataFrame({
+            'position': position,
+            'line': rows.index.to_numpy(dtype='int64'),
+            'date': rows['date'].to_numpy(),
+            'reference': rows['description'].str.extract(REFERENCE_PATTERN, expand=False).str.upper().to_numpy(),
+        }).dropna(subset=['date'])
+
+    paired = pd.Series(pd.NA, index=charges.index, dtype='Int64')
+    if charges.empty or transfers.empty:
+        return paired
+
+    # Charge lines are measured from the transfer end of the block of charge lines they belong to
+    lines = charges.index.to_numpy(dtype='int64')
+    if direction == 'forward':
+        block_ends = np.append(np.diff(lines) != 1, True)
+        position = np.minimum.accumulate(np.where(block_ends, lines, lines[-1])[::-1])[::-1]
+    else:
+        block_starts = np.insert(np.diff(lines) != 1, 0, True)
+        position = np.maximum.accumulate(np.where(block_starts, lines, lines[0]))
+    left = keys(charges, position)
+    right = keys(transfers, transfers.index.to_numpy(dtype='int64')).rename(columns={'line': 'transfer'})
+
+    by_reference = left['reference'].notna()
+    referenced = right[right['reference'].notna()]
+    if by_reference.any() and not referenced.empty:
+        matched = pd.merge_asof(left[by_reference], referenced, on='position', by=['date', 'reference'],
+                                direction='nearest')
+        paired.loc[matched['line'].to_numpy()] = matched['transfer'].astype('Int64').to_numpy()
+
+    rest = left[paired.loc[left['line'].to_numpy()].isna().to_numpy()]
+    if not rest.empty:
+        matched = pd.merge_asof(rest.drop(columns='reference'), right.drop(columns='reference'), on='position',
+                                by='date', direction=direction, tolerance=max_distance)
+        paired.loc[matched['line'].to_numpy()] = matched['transfer'].astype('Int64').to_numpy()
+    return paired
+
+
+def pair_stamp_duty(charges, credits, lag_days=STAMP_DUTY_LAG_DAYS):
+    """
+    Pair stamp duty charge lines with the credits they were levied on.
+
+    Credits are bucketed by date and numbered in line order within each date, and so are
+    charges, so one hash join on (date, number) pairs the n-th charge of a day with the n-th
+    credit of that day. Charges left over are joined again against the remaining credits of
+    each earlier day, up to lag_days before. Each charge and each credit is paired at most
+    once. Returns the credit's line number per charge line, NA where none was found.
+    """
+    paired = pd.Series(pd.NA, index=charges.index, dtype='Int64')
+    open_charges = charges['date'].dropna()
+    open_credits = credits['date'].dropna()
+    for lag in range(lag_days + 1):
+        if open_charges.empty or open_credits.empty:
+            break
+        left = pd.DataFrame({'date': (open_charges - pd.Timedelta(days=lag)).to_numpy(),
+                             'charge': open_charges.index.to_numpy()})
+        right = pd.DataFrame({'date': open_credits.to_numpy(), 'credit': open_credits.index.to_numpy()})
+        left['nth'] = left.groupby('date').cumcount()
+        right['nth'] = right.groupby('date').cumcount()
+        matched = left.merge(right, on=['date', 'nth'])
+        paired.loc[matched['charge'].to_numpy()] = matched['credit'].to_numpy()
+        open_charges = open_charges.drop(matched['charge'])
+        open_credits = open_credits.drop(matched['credit'])
+    return paired
+
+
+def process_pool(workers, **options):
+    """
+    ProcessPoolExecutor of spawned workers. Analyses run on background threads of the app and
+    the server, and forking a process while other threads hold locks can deadlock the child.
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'), **options)
+
+
+def extract_page(page, layout=None):
+    """
+    A PDF page's text, or with a ColumnLayout, its rows of cells (see ColumnLayout.page_rows)
+    """
+    return page.extract_text() if layout is None else layout.page_rows(page)
+
+
+# The PDF and ColumnLayout a page-extraction worker process reads, set up once per worker
+# by open_worker_pdf, so only page ranges are sent with each chunk
+_worker_pdf = None
+_worker_layout = None
+
+
+def open_worker_pdf(pdf_bytes, layout=None):
+    """
+    Open the PDF a page-extraction worker will read, as the pool's initializer
+    """
+    global _worker_pdf, _worker_layout
+    _worker_pdf = pdfplumber.open(io.BytesIO(pdf_bytes))
+    _worker_layout = layout
+
+
+def extract_page_texts(start, stop):
+    """
+    extract_page() for pages [start, stop) of the worker's PDF. Runs in a worker process.
+    """
+    texts = []
+    for page in _worker_pdf.pages[start:stop]:
+        texts.append(extract_page(page, _worker_layout))
+        page.close()
+    return texts
+
+
+class EFTChargeAnalyzer:
+    def __init__(self, max_workers=None, parallel_min_pages=PARALLEL_MIN_PAGES, cache=None, csv_profiles=None,
+                 error_handler=None, fee_schedule=None, progress_handler=None, pdf_tables=True):
+        # PDF pages are extracted across max_workers processes (default: one per CPU)
+        self.max_workers = max_workers
+        self.parallel_min_pages = parallel_min_pages
+        # Read PDFs whose pages carry a column header as tables (see extract_pdf_data);
+        # pdf_columns are the header labels of the last one read that way
+        self.pdf_tables = pdf_tables
+        self.pdf_columns = None
+        # Optional AnalysisCache of ingested documents
+        self.cache = cache
+        # CSV column-mapping profiles (default: csv_profiles.json) and the one matched by the last CSV
+        self.csv_profiles = csv_profiles if csv_profiles is not None else load_csv_profiles()
+        self.csv_profile = None
+        # Name of the bank format (see bank_formats) detected in the last document, None when
+        # no registered format was recognized and dates were looked for in every format
+        self.bank_format = None
+        # One row per statement merged by process_documents()
+        self.sources = pd.DataFrame()
+        # Effective-dated fee rules (default: fee_schedule.csv)
+        self.fee_schedule = fee_schedule if fee_schedule is not None else FeeSchedule.load()
+        # Problems met while processing, in order; error_handler (e.g. st.error) also sees each one
+        self.errors = []
+        self.error_handler = error_handler
+        # Called as progress_handler(step, done, total) while a document is ingested;
+        # total is None when it is not known in advance
+        self.progress_handler = progress_handler
+        self.raw_data = None
+        self.file_type = None
+        self._text_data = ""
+        self._table_stale = True
+        self.classifier = LineClassifier()
+        self.transactions = pd.DataFrame()
+        self.aggregates = self._new_aggregates()
+        self.nip_data = pd.DataFrame()
+        self.nip_charge_vat_data = pd.DataFrame()
+        self.stamp_duty_data = pd.DataFrame()
+        self.account_maintenance_fee_data = pd.DataFrame()
+        self.atm_withdrawal_fee_data = pd.DataFrame()
+        # New attributes for additional data
+        self.otp_data = pd.DataFrame()
+        self.card_maintenance_fee_data = pd.DataFrame()
+        self.card_issuance_data = pd.DataFrame()
+        self.forex_data = pd.DataFrame()
+        self.bill_payment_data = pd.DataFrame()
+        self.statement_request_data = pd.DataFrame()
+        self.hardware_token_data = pd.DataFrame()
+        self.loan_fees_data = pd.DataFrame()
+        self.apg_charges_data = pd.DataFrame()
+        self.sms_charges_data = pd.DataFrame()
+        # Column totals of each fee table by FEE_CHECKS result name, as Int64 kobo Series named
+        # after what they total; the tables themselves hold only transaction rows
+        self.totals = {}
+
+    def report_error(self, message):
+        """
+        Record a processing error and pass it on to the error handler, if any
+        """
+        self.errors.append(message)
+        if self.error_handler is not None:
+            self.error_handler(message)
+
+    def report_progress(self, step, done, total=None):
+        """
+        Pass ingestion progress, e.g. PDF pages extracted so far, to the progress handler, if any
+        """
+        if self.progress_handler is not None:
+            self.progress_handler(step, done, total)
+
+    @property
+    def text_data(self):
+        """
+        The statement text. Streamed documents keep only the transaction table,
+        so their text is rebuilt from it on each access.
+        """
+        if self._text_data is not None:
+            return self._text_data
+        table = self.transaction_table()
+        return '\n'.join(table['description']) if not table.empty else None
+
+    @text_data.setter
+    def text_data(self, text):
+        self._text_data = text
+        self._table_stale = True
+
+    def has_text(self):
+        """
+        Whether there is any statement text to analyze, without rebuilding it
+        """
+        return bool(self._text_data) or not self.transaction_table().empty
+
+    def iter_pdf_pages(self, pdf_file, layout=None, first_page=0):
+        """
+        Yield the text of each PDF page in order, releasing each page's cached objects once extracted.
+        With a ColumnLayout, yield each page's rows of cells instead, from first_page on.
+        Large documents are extracted across a process pool.
+        """
+        try:
+            pdf_bytes = read_document_bytes(pdf_file)
+            with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+                page_count = len(pdf.pages)
+                workers = min(self.max_workers or os.cpu_count() or 1, page_count - first_page)
+                self.report_progress('pages', first_page, page_count)
+                if workers <= 1 or page_count - first_page < self.parallel_min_pages:
+                    for done, page in enumerate(pdf.pages[first_page:], first_page + 1):
+                        text = extract_page(page, layout)
+                        page.close()
+                        self.report_progress('pages', done, page_count)
+                        yield text
+                    return
+
+            # Several contiguous page ranges per worker to even out uneven pages
+            chunk_size = math.ceil((page_count - first_page) / (workers * 4))
+            starts = range(first_page, page_count, chunk_size)
+            stops = [min(start + chunk_size, page_count) for start in starts]
+            with process_pool(workers, initializer=open_worker_pdf, initargs=(pdf_bytes, layout)) as executor:
+                chunks = executor.map(extract_page_texts, starts, stops)
+                for stop, chunk in zip(stops, chunks):
+                    self.report_progress('pages', stop, page_count)
+                    yield from chunk
+        except Exception as e:
+            self.report_error(f"Error extracting PDF: {e}")
+
+    def iter_pdf_lines(self, pdf_file):
+        """
+        Yield the text lines of a PDF page by page, skipping empty pages
+        """
+        for text in self.iter_pdf_pages(pdf_file):
+            if text:
+                yield from text.split('\n')
+
+    def extract_pdf_text(self, pdf_file):
+        """
+        Extract text from PDF pages
+        """
+        full_text = [text for text in self.iter_pdf_pages(pdf_file) if text]
+        return "\n".join(full_text) if full_text else None
+
+    def extract_pdf_data(self, pdf_file):
+        """
+        Read a PDF in one pass into the transaction table.
+
+        When one of the first HEADER_SEARCH_PAGES pages has a column header matching a
+        column-mapping profile, its column geometry is measured once, every page is cut into
+        rows of cells along it, and the rows are mapped like a structured CSV export, with no
+        text layout or line parsing. Anything else is read as text lines.
+        raw_data keeps the first CSV_PREVIEW_ROWS rows of a table for display.
+        """
+        self.raw_data = None
+        self.pdf_columns = None
+        layout, first_page = self.detect_pdf_layout(pdf_file) if self.pdf_tables else (None, None)
+        if layout is None:
+            self.ingest_lines(timed_iter(self.iter_pdf_lines(pdf_file), 'extract_pdf_text', logger))
+            return
+
+        self.pdf_columns = layout.headers
+        chunks = timed_iter(self.iter_pdf_table_chunks(pdf_file, layout, first_page), 'extract_pdf_tables',
+                            logger, size=len)
+        first_chunk = next(chunks, None)
+        if first_chunk is not None:
+            self.raw_data = first_chunk.head(CSV_PREVIEW_ROWS)
+            chunks = chain([first_chunk], chunks)
+        self.ingest_profile_columns(chunks, layout.profile, layout.columns)
+
+    def detect_pdf_layout(self, pdf_file):
+        """
+        (ColumnLayout, index of the page with the header) of a tabular PDF, or (None, None)
+        """
+        try:
+            pdf_bytes = read_document_bytes(pdf_file)
+            with pdfplumber.open(io.BytesIO(pdf_bytes), pages=range(1, HEADER_SEARCH_PAGES + 1)) as pdf:
+                return find_column_layout(pdf.pages, self.column_profiles(), resolve_csv_columns)
+        except Exception as e:
+            # The text reader reports anything wrong with the file itself
+            logger.debug("No column layout found, reading the PDF as text: %s", e)
+            return None, None
+
+    def iter_pdf_table_chunks(self, pdf_file, layout, first_page=0):
+        """
+        Yield the rows of a tabular PDF as DataFrames of about PDF_TABLE_CHUNK_ROWS rows,
+        with the header labels as columns
+        """
+        rows = []
+        for page_rows in self.iter_pdf_pages(pdf_file, layout, first_page):
+            rows.extend(page_rows)
+            if len(rows) >= PDF_TABLE_CHUNK_ROWS:
+                yield layout.frame(rows)
+                rows = []
+        if rows:
+            yield layout.frame(rows)
+
+    def extract_csv_data(self, csv_file):
+        """
+        Read a CSV file in one pass into the transaction table.
+
+        Exports whose header matches a column-mapping profile are mapped column by column;
+        anything else is read as one statement line per row.
+        raw_data keeps the first CSV_PREVIEW_ROWS rows for display.
+        """
+        try:
+            self.raw_data = None
+            self.csv_profile = None
+            chunks = timed_iter(self.iter_csv_chunks(csv_file), 'read_csv', logger, size=len)
+            first_chunk = next(chunks, None)
+            if first_chunk is None:
+                self.ingest_lines([])
+                return self.raw_data
+
+            self.raw_data = first_chunk.head(CSV_PREVIEW_ROWS)
+            chunks = chain([first_chunk], chunks)
+            profile, columns = resolve_csv_columns(first_chunk.columns, self.column_profiles())
+            if columns is not None:
+                self.csv_profile = profile
+                self.ingest_profile_columns(chunks, profile, columns)
+            else:
+                self.ingest_lines(line for chunk in chunks for line in csv_row_lines(chunk))
+            return self.raw_data
+        except Exception as e:
+            self.report_error(f"Error reading CSV: {e}")
+            return None
+
+    def iter_csv_chunks(self, csv_file):
+        """
+        Yield the CSV as text-column chunks of CSV_CHUNK_ROWS rows.
+        The encoding is detected from the first ENCODING_SAMPLE_BYTES bytes.
+        """
+        csv_file.seek(0)
+        encoding = sniff_encoding(csv_file.read(ENCODING_SAMPLE_BYTES))
+        csv_file.seek(0)
+
+        reader = pd.read_csv(csv_file, encoding=encoding, encoding_errors='replace', dtype=str,
+                             chunksize=CSV_CHUNK_ROWS)
+        rows = 0
+        with reader:
+            for chunk in reader:
+                rows += len(chunk)
+                self.report_progress('rows', rows)
+                yield chunk
+
+    def process_document(self, uploaded_file):
+        """
+        Process uploaded document based on file type.
+        With a cache, a document seen before is restored without being extracted again.
+        """
+        file_type = document_file_type(uploaded_file.name)
+        if file_type is None:
+            self.report_error("Unsupported file type. Please upload PDF or CSV.")
+            return None
+        self.sources = pd.DataFrame()
+
+        with log_stage('process_document', logger, file_type=file_type, cache='off') as stage:
+            cache_key = None
+            if self.cache is not None:
+                cache_key = self.cache_key(read_document_bytes(uploaded_file), file_type)
+                cached = self.cache.get(cache_key)
+                stage['cache'] = 'miss' if cached is None else 'hit'
+                if cached is not None:
+                    self.restore(cached)
+                    stage['rows'] = len(self.transactions)
+                    return self._document_result()
+
+            self.file_type = file_type
+            if file_type == 'pdf':
+                self.extract_pdf_data(uploaded_file)
+            else:
+                self.raw_data = self.extract_csv_data(uploaded_file)
+                self.transaction_table()
+            stage['rows'] = len(self.transactions)
+            stage['bank_format'] = self.bank_format
+
+            result = self._document_result()
+            if cache_key is not None and result is not None:
+                self.cache.put(cache_key, self.snapshot())
+            return result
+
+    def process_documents(self, uploaded_files):
+        """
+        Process several statements of one account concurrently and analyze them as one.
+
+        Each document is ingested on its own, across up to max_workers processes, or restored
+        from the cache; their tables are then merged into one timeline with lines repeated
+        across overlapping statements dropped (see merge_statement_tables). Returns the merged
+        table, or None when no document yielded any lines.
+        """
+        documents = []
+        for uploaded_file in uploaded_files:
+            name = os.path.basename(getattr(uploaded_file, 'name', str(uploaded_file)))
+            if document_file_type(name) is None:
+                self.report_error(f"{name}: Unsupported file type. Please upload PDF or CSV.")
+                continue
+            documents.append((name, read_document_bytes(uploaded_file)))
+
+        with log_stage('process_documents', logger, documents=len(documents)) as stage:
+            snapshots = [None] * len(documents)
+            pending = []
+            for position, (name, document_bytes) in enumerate(documents):
+                cache_key = None
+                if self.cache is not None:
+                    cache_key = self.cache_key(document_bytes, document_file_type(name))
+                    snapshots[position] = self.cache.get(cache_key)
+                if snapshots[position] is None:
+                    pending.append((position, cache_key))
+            stage['cache_hits'] = len(documents) - len(pending)
+
+            results = self._ingest_concurrently([documents[position] for position, _ in pending])
+            for (position, cache_key), (snapshot, errors) in zip(pending, results):
+                for error in errors:
+                    self.report_error(f"{documents[position][0]}: {error}")
+                if snapshot is not None and cache_key is not None:
+                    self.cache.put(cache_key, snapshot)
+                snapshots[position] = snapshot
+
+            tables = [(name, snapshot['transactions']) for (name, _), snapshot in zip(documents, snapshots)
+                      if snapshot is not None and not snapshot['transactions'].empty]
+            self.file_type = None
+            self.raw_data = None
+            self.csv_profile = None
+            self.pdf_columns = None
+            self.bank_format = None
+            if not tables:
+                self.transactions = pd.DataFrame()
+                self.sources = pd.DataFrame()
+                self._text_data = ""
+                self._table_stale = True
+                return None
+
+            self.transactions, dropped = merge_statement_tables(tables)
+            self.aggregates = self._new_aggregates()
+            self.aggregates.update(self.transactions)
+            self._text_data = None
+            self._table_stale = False
+
+            by_source = self.transactions.groupby('source', observed=False)['date']
+            self.sources = pd.DataFrame({
+                'Lines': by_source.size(),
+                'Duplicate Lines Dropped': dropped.to_numpy(),
+                'First Date': format_dates(by_source.min()),
+                'Last Date': format_dates(by_source.max()),
+            }).rename_axis('Statement').reset_index()
+            stage['rows'] = len(self.transactions)
+            stage['duplicates'] = int(dropped.sum())
+            return self.transactions
+
+    def cache_key(self, document_bytes, file_type):
+        """
+        Cache key of a document ingested by this analyzer: its bytes and type, the parser version,
+        and everything else that shapes the table, i.e. whether PDFs are read as tables, the
+        column-mapping profiles and the registered bank formats
+        """
+        return self.cache.key(document_bytes, PARSER_VERSION, file_type, self.pdf_tables,
+                              json.dumps(self.csv_profiles, sort_keys=True), registry_fingerprint())
+
+    def _ingest_concurrently(self, documents):
+        """
+        ingest_document() for each (name, bytes), in parallel when there is more than one
+        """
+        workers = min(self.max_workers or os.cpu_count() or 1, len(documents))
+        self.report_progress('documents', 0, len(documents))
+        if workers <= 1:
+            results = (ingest_document(name, document_bytes, self.csv_profiles, self.max_workers, self.pdf_tables)
+                       for name, document_bytes in documents)
+            return self._count_documents(results, len(documents))
+
+        # Documents are already spread over the processes, so each extracts its pages serially
+        names, contents = zip(*documents)
+        with process_pool(workers) as executor:
+            results = executor.map(ingest_document, names, contents, repeat(self.csv_profiles), repeat(1),
+                                   repeat(self.pdf_tables))
+            return self._count_documents(results, len(documents))
+
+    def _count_documents(self, results, total):
+        collected = []
+        for result in results:
+            collected.append(result)
+            self.report_progress('documents', len(collected), total)
+        return collected
+
+    def _document_result(self):
+        if self.file_type == 'csv':
+            return self.raw_data
+        return self.transactions if not self.transactions.empty else None
+
+    def snapshot(self):
+        """
+        Return the ingested state of the document, as stored in the cache
+        """
+        return {
+            'file_type': self.file_type,
+            'raw_data': self.raw_data,
+            'csv_profile': self.csv_profile,
+            'bank_format': self.bank_format,
+            'pdf_columns': self.pdf_columns,
+            'transactions': self.transaction_table(),
+        }
+
+    def restore(self, snapshot):
+        """
+        Load the ingested state saved by snapshot()
+        """
+        self.file_type = snapshot['file_type']
+        self.raw_data = snapshot['raw_data']
+        self.csv_profile = snapshot['csv_profile']
+        self.bank_format = snapshot['bank_format']
+        self.pdf_columns = snapshot['pdf_columns']
+        self.transactions = snapshot['transactions']
+        self.aggregates = self._new_aggregates()
+        self.aggregates.update(self.transactions)
+        self._text_data = None
+        self._table_stale = False
+
+    def ingest_lines(self, lines):
+        """
+        Stream lines into the transaction table. Lines are parsed in batches of
+        INGEST_CHUNK_LINES, so only one batch of raw text is held besides the table.
+        """
+        self.transactions = self._build_table(lines)
+        self._text_data = None
+        self._table_stale = False
+        return self.transactions
+
+    def column_profiles(self):
+        """
+        Column-mapping profiles tried on CSV and PDF table headers: the column hints of the
+        registered bank formats, then csv_profiles
+        """
+        return column_profiles(self.csv_profiles)
+
+    def ingest_profile_columns(self, chunks, profile, columns):
+        """
+        ingest_csv_columns() with the date format of a column_profiles() profile.
+        A bank format's own column hints fix the bank format too.
+        """
+        date_format = self.column_profiles()[profile].get('date_format')
+        self.ingest_csv_columns(chunks, columns, date_format, profile if profile in BANK_FORMATS else None)
+
+    def ingest_csv_columns(self, chunks, columns, date_format=None, bank_format=None):
+        """
+        Build the transaction table from structured CSV chunks through a resolved column mapping.
+        Without a date_format or bank_format, the bank format is detected from the first dates.
+        """
+        self.aggregates = self._new_aggregates()
+        self.bank_format = bank_format
+        timer = StageTimer('map_csv_columns', logger)
+        frames = []
+        start = 0
+        for chunk in chunks:
+            with timer:
+                if not frames and date_format is None and bank_format is None:
+                    self.bank_format = detect_bank_format(chunk[columns['date']].head(DETECTION_SAMPLE_LINES))
+                self._add_batch(frames, build_csv_transaction_table(
+                    chunk, columns, self.classifier, date_format, start, self.bank_format))
+            start += len(chunk)
+        if not frames:
+            return self.ingest_lines([])
+        self.transactions = pd.concat(frames) if len(frames) > 1 else frames[0]
+        timer.emit(rows=len(self.transactions))
+        self._text_data = None
+        self._table_stale = False
+        return self.transactions
+
+    def transaction_table(self):
+        """
+        Return the normalized transaction table.
+        Text assigned to text_data is parsed once and the table reused until it changes.
+        """
+        if self._table_stale:
+            self.transactions = self._build_table(self._text_data.split('\n') if self._text_data else [])
+            self._table_stale = False
+        return self.transactions
+
+    def _build_table(self, lines):
+        self.aggregates = self._new_aggregates()
+        self.bank_format = None
+        # Parsing runs between batches of extraction, so its time is summed over the batches
+        timer = StageTimer('parse_lines', logger)
+        frames = []
+
+        def parse(chunk):
+            if not frames:
+                # Detected once, from about the first page, and used for every batch
+                self.bank_format = detect_bank_format(chunk[:DETECTION_SAMPLE_LINES])
+            self._add_batch(frames, build_transaction_table(
+                chunk, self.classifier, start=len(frames) * INGEST_CHUNK_LINES, bank_format=self.bank_format))
+
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) == INGEST_CHUNK_LINES:
+                with timer:
+                    parse(chunk)
+                chunk = []
+        with timer:
+            parse(chunk)
+            table = pd.concat(frames) if len(frames) > 1 else frames[0]
+        timer.emit(rows=len(table))
+        return table
+
+    def _new_aggregates(self):
+        return TransactionAggregates(self.classifier.bits['debit'], self.classifier.bits['atm_withdrawal'])
+
+    def _add_batch(self, frames, frame):
+        frames.append(frame)
+        self.aggregates.update(frame)
+        if logger.isEnabledFor(logging.DEBUG):
+            # A sample of the batch is enough to follow parsing without flooding the log
+            for line, row in frame.iloc[::DEBUG_SAMPLE_EVERY].iterrows():
+                logger.debug("line %d: date=%s amount=%s tags=%#x %r", line, row['date'], row['amount'],
+                             row['tags'], row['description'][:80])
+
+    def category_rows(self, category):
+        """
+        Return the transaction table rows tagged with a LINE_CATEGORIES category
+        """
+        table = self.transaction_table()
+        return table[(table['tags'] & self.classifier.bits[category]) != 0]
+
+    def _set_totals(self, name, label, table, columns):
+        """
+        Record the totals of a fee table's money columns under its FEE_CHECKS result name
+        """
+        self.totals[name] = table[columns].sum().astype('Int64').rename(label)
+
+    def _fee_listing(self, name, category, none_found, total_label):
+        """
+        List the lines of a fee category with their amounts, recording their total
+        """
+        rows = self.category_rows(category)
+        listing = pd.DataFrame({
+            'Line': line_numbers(rows),
+            'Description': rows['description'].to_numpy(),
+            'Amount': rows['amount'].fillna(0).array
+        })
+        self._set_totals(name, total_label, listing, ['Amount'])
+        if listing.empty:
+            listing = pd.DataFrame({'Line': pd.array([pd.NA], dtype='Int64'), 'Description': [none_found],
+                                    'Amount': pd.array([0], dtype='Int64')})
+        return listing
+
+    @logged_stage
+    def find_otp_entries(self):
+        """
+        Find all lines with "OTP" from the extracted text data
+        """
+        if not self.has_text():
+            self.report_error("No text data to analyze")
+            return pd.DataFrame()
+
+        self.otp_data = self._fee_listing('otp', 'otp', "No OTP", 'Total OTP Charges')
+        return self.otp_data
+
+    # def find_card_maintenance_fee_entries(self):
+    #     """
+    #     Extract all 'Account Maintenance Fee' entries, ensuring comprehensive parsing and handling format inconsistencies.
+    #     """
+    #     if not self.text_data:
+    #         print("No text data to analyze")
+    #         return pd.DataFrame()
+    #
+    #     # Split the text data into lines
+    #     lines = self.text_data.splitlines()
+    #
+    #     # Debug: Preview of lines
+    #     print("Preview of text data:")
+    #     print(lines[:20])  # Adjust as necessary for debugging
+    #
+    #     # Storage for results
+    #     data = []
+    #     total_actual = 0
+    #     total_expected = 0
+    #     total_overcharged = 0
+    #
+    #     # Helper function to extract numeric values
+    #     def extract_amount(line):
+    #         match = re.search(r'[\d,]+\.\d{2}', line)
+    #         return float(match.group().replace(',', '')) if match else None
+    #
+    #     # Helper function to identify fee description lines
+    #     def is_fee_line(line):
+    #         return "ACCOUNT MAINTENANCE FEE" in line.upper()
+    #
+    #     current_date = None
+    #
+    #     for line in lines:
+    #         # Debug: Process each line
+    #         print(f"Processing line: {line}")
+    #
+    #         # Extract date if present
+    #         date_match = re.search(r'\d{2}-[A-Z]{3}-\d{2}|\d{2}/\d{2}/\d{4}', line)
+    #         if date_match:
+    #             current_date = date_match.group()
+    #             print(f"Found date: {current_date}")
+    #
+    #         # Identify maintenance fee lines
+    #         if is_fee_line(line):
+    #             print(f"Found fee line: {line}")
+    #             amount = extract_amount(line)
+    #             if amount is None:
+    #                 print(f"Skipping line due to missing amount: {line}")
+    #                 continue
+    #
+    #             # Calculate charges
+    #             actual_charge = amount
+    #             expected_charge = round(amount / 1000, 2)
+    #             overcharged_amount = round(actual_charge - expected_charge, 2)
+    #
+    #             # Update totals
+    #             total_actual += actual_charge
+    #             total_expected += expected_charge
+    #             total_overcharged += overcharged_amount
+    #
+    #             # Add to results
+    #             data.append({
+    #                 'Date of Transaction': current_date,
+    #                 'Amount': actual_charge,
+    #                 'Description': line.strip(),
+    #                 'Actual Charge': round(actual_charge, 2),
+    #                 'Expected Charge': round(expected_charge, 2),
+    #                 'Overcharged Amount': round(overcharged_amount, 2),
+    #             })
+    #
+    #     # Add summary row if data exists
+    #     if data:
+    #         data.append({
+    #             'Date of Transaction': '---',
+    #             'Amount': None,
+    #             'Description': 'Total Account Maintenance Fee',
+    #             'Actual Charge': round(total_actual, 2),
+    #             'Expected Charge': round(total_expected, 2),
+    #             'Overcharged Amount': round(total_overcharged, 2),
+    #         })
+    #
+    #     # Convert to DataFrame
+    #     result_df = pd.DataFrame(data)
+    #
+    #     # Debug: Print results
+    #     print("Extracted DataFrame:")
+    #     print(result_df)
+    #
+    #     return result_df
+
+    @logged_stage
+    def find_card_maintenance_fee_entries(self):
+        """
+        Extract all 'Account Maintenance Fee' entries, ensuring comprehensive parsing and handling format inconsistencies.
+        """
+        if not self.has_text():
+            logger.warning("No text data to analyze")
+            return pd.DataFrame()
+
+        # Transactions grouped by date, from the shared aggregates
+        self.transaction_table()
+        transactions_by_date = self.aggregates.daily_amounts
+        logger.debug("Transactions grouped by date: %d dates, %s kobo total",
+                     len(transactions_by_date), transactions_by_date.sum())
+
+        # Maintenance fee lines, skipping any without an amount
+        fees = self.category_rows('account_maintenance')
+        fees = fees[fees['amount'].notna()]
+
+        # Calculate charges, to the nearest kobo
+        actual_charge = fees['amount']
+        rate = self.fee_schedule.rate('account_maintenance', fees['amount'], fees['date'], undated_latest=True)
+        day_total = fees['date'].map(transactions_by_date).astype('Float64').fillna(0)
+        expected_charge = (day_total * rate).round().astype('Int64')
+        overcharged_amount = fees['amount'] - expected_charge
+
+        result_df = pd.DataFrame({
+            'Line': line_numbers(fees),
+            'Date of Transaction': format_dates(fees['date']).to_numpy(),
+            'Amount': fees['amount'].array,
+            'Description': fees['description'].str.strip().to_numpy(),
+            'Actual Charge': actual_charge.array,
+            'Expected Charge': expected_charge.array,
+            'Overcharged Amount': overcharged_amount.array,
+        })
+
+        self._set_totals('card_maintenance', 'Total Account Maintenance Fee', result_df,
+                         ['Actual Charge', 'Expected Charge', 'Overcharged Amount'])
+        return result_df
+
+    @logged_stage
+    def find_sms_charges(self):
+        """
+        Find all lines with "SMS Charges", "Notification Fee", or "Alert Fee"
+        and calculate the overcharged amount.
+        """
+        if not self.has_text():
+            self.report_error("No text data to analyze")
+            return pd.DataFrame()
+
+        rows = self.category_rows('sms')
+
+        if rows.empty:
+            self.totals.pop('sms', None)
+            no_amount = pd.array([pd.NA], dtype='Int64')
+            return pd.DataFrame({
+                'S/N': no_amount,
+                'Line': no_amount,
+                'Date': [None],
+                'Description': ["There was no SMS charge"],
+                'Transaction Amount/Actual Charge': no_amount,
+                'Expected Charge': no_amount,
+                'Overcharged Amount': no_amount
+            })
+
+        actual_charge = rows['amount'].fillna(0)
+        expected_charge = self.fee_schedule.charge('sms_alert', actual_charge, rows['date'], undated_latest=True)
+        overcharged_amount = (actual_charge - expected_charge).clip(lower=0)
+
+        self.sms_charges_data = pd.DataFrame({
+            'S/N': pd.array(range(1, len(rows) + 1), dtype='Int64'),
+            'Line': line_numbers(rows),
+            'Date': format_dates(rows['date']).to_numpy(),
+            'Description': rows['description'].to_numpy(),
+            'Transaction Amount/Actual Charge': actual_charge.array,
+            'Expected Charge': expected_charge,
+            'Overcharged Amount': overcharged_amount.array
+        })
+        self._set_totals('sms', 'Total', self.sms_charges_data, ['Overcharged Amount'])
+        return self.sms_charges_data
+
+    @logged_stage
+    def find_card_issuance_entries(self):
+        """
+        Find all lines with "Card Issuance Fee", "Card Replacement", or "Card Renewal"
+        """
+        if not self.has_text():
+            self.report_error("No text data to analyze")
+            return pd.DataFrame()
+
+        self.card_issuance_data = self._fee_listing(
+            'card_issuance', 'card_issuance',
+            "No Card Issuance/Replacement/Renewal Fees Found",
+            'Total Card Issuance/Replacement/Renewal Fees')
+        return self.card_issuance_data
+
+    @logged_stage
+    def find_forex_entries(self):
+        """
+        Find all lines with "FX Charges", "Foreign Exchange Fee", or "Domiciliary Withdrawal Fee"
+        """
+        if not self.has_text():
+            self.report_error("No text data to analyze")
+            return pd.DataFrame()
+
+        self.forex_data = self._fee_listing(
+            'forex', 'forex',
+            "No Foreign Exchange Charges Found",
+            'Total Foreign Exchange Charges')
+        return self.forex_data
+
+    @logged_stage
+    def find_bill_payment_entries(self):
+        """
+        Find all lines with "Bill Payment", "Utility Charges", or "E-Channel Fee"
+        """
+        if not self.has_text():
+            self.report_error("No text data to analyze")
+            return pd.DataFrame()
+
+        self.bill_payment_data = self._fee_listing(
+            'bill_payment', 'bill_payment',
+            "No Bill Payment/Utility Charges/E-Channel Fee Found",
+            'Total Bill Payment/Utility Charges/E-Channel Fee')
+        return self.bill_payment_data
+
+    @logged_stage
+    def find_statement_request_entries(self):
+        """
+        Find all lines with "Statement Fee", "Account Statement Charge", or "Custom Statement"
+        """
+        if not self.has_text():
+            self.report_error("No text data to analyze")
+            return pd.DataFrame()
+
+        self.statement_request_data = self._fee_listing(
+            'statement_request', 'statement_request',
+            "No Statement Fee/Account Statement Charge/Custom Statement Found",
+            'Total Statement Fees')
+        return self.statement_request_data
+
+    @logged_stage
+    def find_hardware_token_entries(self):
+        """
+        Find all lines with "Token Fee", "Hardware Token Charge", "Token Replacement", "Interest Charge",
+        "Loan Fee", "Restructuring Fee", or "Late Payment Fee"
+        """
+        if not self.has_text():
+            self.report_error("No text data to analyze")
+            return pd.DataFrame()
+
+        self.hardware_token_data = self._fee_listing(
+            'hardware_token', 'hardware_token',
+            "No Token/Loan/Interest Fees Found",
+            'Total Token/Loan/Interest Fees')
+        return self.hardware_token_data
+
+    @logged_stage
+    def find_ef_transfers(self):
+        """
+        Validate EFT transfers (NIP, TRF and other transfer lines) against the transfer tariff.
+
+        Each line counts once, as the first of EFT_TYPES it matches. Charge and VAT lines are
+        paired with their transfer (pair_charge_lines), whose actual charge is then what was
+        posted for it, or its inline "Charge:" amount when nothing was. Charge lines paired
+        with no transfer are listed on their own; incoming transfers are not priced.
+        """
+        if not self.has_text():
+            self.report_error("No text data to analyze")
+            return pd.DataFrame()
+
+        bits = self.classifier.bits
+        table = self.transaction_table()
+        rows = table[(table['tags'] & reduce(operator.or_, (bits[category] for _, category in EFT_TYPES))) != 0]
+        types = pd.Series(pd.Categorical(
+            np.select([(rows['tags'] & bits[category]).to_numpy() != 0 for _, category in EFT_TYPES],
+                      [transaction_type for transaction_type, _ in EFT_TYPES], default=EFT_TYPES[-1][0]),
+            categories=[transaction_type for transaction_type, _ in EFT_TYPES]), index=rows.index)
+
+        is_charge = types.isin(EFT_CHARGE_TYPES)
+        transfers, charges = rows[~is_charge], rows[is_charge]
+        dates = table['date'].dropna()
+        newest_first = len(dates) > 1 and dates.iloc[0] > dates.iloc[-1]
+        outgoing = (transfers['direction'] != 'credit').fillna(True)
+        paired = pair_charge_lines(transfers[outgoing], charges, 'forward' if newest_first else 'backward')
+
+        # What was posted for each transfer, and on which lines
+        posted = charges['amount'].groupby(paired).sum()
+        posted_lines = join_by(pd.Series(charges.index + 1, index=charges.index).astype(str), paired)
+        actual_charge = transfers.index.to_series().map(posted).astype('Int64').fillna(transfers['charge'])
+
+        # Transfers out are priced by the NIP tariff in force on their date; undated or zero amounts are not
+        priced = transfers['date'].notna() & (transfers['amount'].fillna(0) != 0) & outgoing
+        expected_charge = pd.Series(
+            self.fee_schedule.charge('nip_transfer', transfers['amount'].fillna(0), transfers['date']),
+            index=transfers.index).where(priced)
+
+        unpaired = charges[paired.isna()]
+        df = pd.concat([
+            pd.DataFrame({
+                'Line': pd.Series(line_numbers(transfers), index=transfers.index),
+                'Date': format_dates(transfers['date']),
+                'Transaction Type': types[transfers.index],
+                'Description': transfers['description'],
+                'Amount': transfers['amount'],
+                'Actual Charge': actual_charge,
+                'Charge Lines': transfers.index.to_series().map(posted_lines),
+                'Expected Charge': expected_charge,
+                'Charge Discrepancy': actual_charge - expected_charge
+            }),
+            pd.DataFrame({
+                'Line': pd.Series(line_numbers(unpaired), index=unpaired.index),
+                'Date': format_dates(unpaired['date']),
+                'Transaction Type': types[unpaired.index],
+                'Description': unpaired['description'],
+                'Amount': pd.Series(pd.NA, index=unpaired.index, dtype='Int64'),
+                'Actual Charge': unpaired['amount'],
+                'Charge Lines': pd.Series(None, index=unpaired.index, dtype=object),
+                'Expected Charge': pd.Series(pd.NA, index=unpaired.index, dtype='Int64'),
+                'Charge Discrepancy': pd.Series(pd.NA, index=unpaired.index, dtype='Int64'),
+            }),
+        ]).sort_index().reset_index(drop=True)
+        self._set_totals('eft_transfers', 'Total', df,
+                         ['Amount', 'Actual Charge', 'Expected Charge', 'Charge Discrepancy'])
+        return df
+
+    @logged_stage
+    def find_stamp_duty_entries(self):
+        """
+        Validate stamp duty charges against the credits they were levied on.
+
+        Each charge is paired with a credit that attracts stamp duty under the fee schedule
+        (₦10,000 and above) on its date or up to STAMP_DUTY_LAG_DAYS before (pair_stamp_duty).
+        Charges on self-to-self transfers, extra charges for a credit and charges with no
+        qualifying credit are overcharges; qualifying credits never charged are listed too.
+        """
+        if not self.has_text():
+            logger.warning("No text data to analyze")
+            return pd.DataFrame()
+
+        bits = self.classifier.bits
+        table = self.transaction_table()
+        is_stamp_duty = (table['tags'] & bits['stamp_duty']) != 0
+        charges = table[is_stamp_duty & (table['direction'] != 'credit').fillna(True)]
+        credits = table[~is_stamp_duty & (table['direction'] == 'credit').fillna(False)
+                        & table['date'].notna() & table['amount'].notna()]
+
+        # Credits that attract stamp duty, and the ones exempt from it as self-to-self transfers
+        duty = pd.Series(self.fee_schedule.charge('stamp_duty', credits['amount'], credits['date']),
+                         index=credits.index)
+        credits, duty = credits[duty > 0], duty[duty > 0]
+        exempt = (credits['tags'] & bits['self_transfer']) != 0
+
+        paired = pair_stamp_duty(charges, credits)
+        credit_line = paired.astype('float64').fillna(-1).astype('int64')
+        on_credit = paired.notna().to_numpy()
+        exempt_charge = (((charges['tags'] & bits['self_transfer']) != 0).to_numpy()
+                         | (on_credit & credit_line.map(exempt).fillna(False).astype(bool).to_numpy()))
+        expected_charge = pd.Series(credit_line.map(duty), index=charges.index, dtype='Int64')
+        expected_charge = expected_charge.where(~exempt_charge, 0).fillna(0)
+
+        # An unpaired charge on a day whose qualifying credits are all charged is a second charge
+        credit_dates = credits['date'].unique()
+        credited_day = np.zeros(len(charges), dtype=bool)
+        for lag in range(STAMP_DUTY_LAG_DAYS + 1):
+            credited_day |= (charges['date'] - pd.Timedelta(days=lag)).isin(credit_dates).to_numpy()
+        finding = np.select(
+            [exempt_charge, on_credit, credited_day],
+            ['Charged on self-to-self transfer', 'Charged', 'Charged twice'], default='No qualifying credit')
+        if credits.empty and not (table['direction'] == 'credit').any():
+            # Without any credit marked, no charge can be checked
+            finding[:] = 'No credits in statement'
+            expected_charge = pd.Series(pd.NA, index=charges.index, dtype='Int64')
+
+        actual_charge = charges['amount'].fillna(0)
+        credit_rows = table.loc[credit_line[on_credit].to_numpy()]
+        charged = pd.DataFrame({
+            'Line': pd.Series(line_numbers(charges), index=charges.index),
+            'Date': format_dates(charges['date']),
+            'Description': charges['description'],
+            'Credit Line': (paired + 1).astype('Int64'),
+            'Credit Amount': pd.Series(credit_rows['amount'].to_numpy(), index=charges.index[on_credit],
+                                       dtype='Int64').reindex(charges.index),
+            'Actual Charge': actual_charge,
+            'Expected Charge': expected_charge,
+            'Overcharged Amount': (actual_charge - expected_charge).clip(lower=0),
+            'Finding': pd.Series(finding, index=charges.index, dtype=STAMP_DUTY_FINDINGS),
+        })
+
+        uncharged = credits[~credits.index.isin(paired.dropna().to_numpy()) & ~exempt]
+        missed = pd.DataFrame({
+            'Line': pd.Series(line_numbers(uncharged), index=uncharged.index),
+            'Date': format_dates(uncharged['date']),
+            'Description': uncharged['description'],
+            'Credit Line': pd.Series(line_numbers(uncharged), index=uncharged.index),
+            'Credit Amount': uncharged['amount'],
+            'Actual Charge': pd.Series(0, index=uncharged.index, dtype='Int64'),
+            'Expected Charge': duty[uncharged.index].astype('Int64'),
+            'Overcharged Amount': pd.Series(0, index=uncharged.index, dtype='Int64'),
+            'Finding': pd.Series('Not charged', index=uncharged.index, dtype=STAMP_DUTY_FINDINGS),
+        })
+
+        self.stamp_duty_data = pd.concat([charged, missed]).sort_index().reset_index(drop=True)
+        self._set_totals('stamp_duty', 'Total Overcharged Amount', self.stamp_duty_data,
+                         ['Actual Charge', 'Expected Charge', 'Overcharged Amount'])
+        return self.stamp_duty_data
+
+    @logged_stage
+    def find_account_maintenance_fee(self):
+        if not self.has_text():
+            self.report_error("No text data to analyze")
+            return pd.DataFrame()
+
+        # Dated debit transactions by month in order of first appearance, from the shared aggregates
+        self.transaction_table()
+        monthly = self.aggregates.monthly_debits
+        if monthly.empty:
+            self.account_maintenance_fee_data = pd.DataFrame()
+            return self.account_maintenance_fee_data
+
+        month_starts = pd.to_datetime(monthly.index.to_series() + '-01')
+        rate = self.fee_schedule.rate('account_maintenance', monthly['Total Debit'], month_starts)
+        expected_charge = (monthly['Total Debit'].astype('Float64') * rate).round().astype('Int64')
+        overcharged_amount = (monthly['Actual Charge'] - expected_charge).clip(lower=0)
+
+        self.account_maintenance_fee_data = pd.DataFrame({
+            'Month': monthly.index.to_numpy(),
+            'Total Debit': monthly['Total Debit'].array,
+            'Actual Charge (₦)': monthly['Actual Charge'].array,
+            'Expected Charge (₦)': expected_charge.array,
+            'Overcharged Amount (₦)': overcharged_amount.array,
+        })
+        return self.account_maintenance_fee_data
+
+    @logged_stage
+    def find_atm_withdrawal_fee(self):
+        """
+        Calculate ATM Withdrawal Fees: Free for the first three withdrawals on other bank ATMs in a month.
+        ₦35 per withdrawal after that.
+        """
+        if not self.has_text():
+            self.report_error("No text data to analyze")
+            return pd.DataFrame()
+
+        # Dated ATM withdrawal transactions
+        rows = self.category_rows('atm_withdrawal')
+        rows = rows[rows['date'].notna()]
+
+        if rows.empty:
+            self.atm_withdrawal_fee_data = pd.DataFrame()
+            return self.atm_withdrawal_fee_data
+
+        # Withdrawal count within each month; charged once the month's free withdrawals are used up
+        withdrawal_count = self.aggregates.atm_sequence.loc[rows.index].to_numpy()
+        free_withdrawals = self.fee_schedule.free_per_month('atm_withdrawal', rows['date'])
+        charge = self.fee_schedule.charge('atm_withdrawal', rows['amount'].fillna(0), rows['date'])
+        fee = pd.Series(charge).where(withdrawal_count > free_withdrawals, 0)
+
+        self.atm_withdrawal_fee_data = pd.DataFrame({
+            'S/N': range(1, len(rows) + 1),
+            'Line': line_numbers(rows),
+            'Value Date': format_dates(rows['date']).to_numpy(),
+            'Description': rows['description'].to_numpy(),
+            'Transaction Amount': rows['amount'].array,
+            'Fee (₦)': fee.array
+        })
+        return self.atm_withdrawal_fee_data
+
+
+# Fee checks run for a full analysis, in display order:
+# (result name, analyzer method, heading, overcharge column)
+FEE_CHECKS = (
+    ('eft_transfers', 'find_ef_transfers', "Electronic Funds Transfer (EFT) Transactions", 'Charge Discrepancy'),
+    ('stamp_duty', 'find_stamp_duty_entries', "Stamp Duty Transactions", 'Overcharged Amount'),
+    ('otp', 'find_otp_entries', "OTP (One-Time Password) Charges Transactions", None),
+    ('card_maintenance', 'find_card_maintenance_fee_entries',
+     "Current Account Maintenance Fee)/Account Maintenance Fee(CAM) Transactions", 'Overcharged Amount'),
+    ('card_issuance', 'find_card_issuance_entries', " Card Issuance, Replacement, and Renewal Fees Transactions",
+     None),
+    ('forex', 'find_forex_entries', "'FX Charges', 'Foreign Exchange Fee', or 'Domiciliary Withdrawal Fee'", None),
+    ('bill_payment', 'find_bill_payment_entries', "'Bill Payment', 'Utility Charges', or 'E-Channel Fee'", None),
+    ('statement_request', 'find_statement_request_entries',
+     "'Statement Fee', 'Account Statement Charge', or 'Custom Statement'", None),
+    ('hardware_token', 'find_hardware_token_entries',
+     "'Token Fee', 'Hardware Token Charge', 'Token Replacement', 'Interest Charge', 'Loan Fee', "
+     "'Restructuring Fee', or 'Late Payment Fee'", None),
+    ('account_maintenance', 'find_account_maintenance_fee', "Account Maintenance Fee", 'Overcharged Amount (₦)'),
+    ('atm_withdrawal', 'find_atm_withdrawal_fee', "ATM Withdrawal Fee", None),
+    ('sms', 'find_sms_charges', "SMS Notification Charges", 'Overcharged Amount'),
+)
+
+# Money columns of the fee tables, all held in kobo
+MONEY_COLUMNS = frozenset({
+    'Amount', 'Actual Charge', 'Expected Charge', 'Charge Discrepancy', 'Overcharged Amount',
+    'Transaction Amount/Actual Charge', 'Total Debit', 'Actual Charge (₦)', 'Expected Charge (₦)',
+    'Overcharged Amount (₦)', 'Transaction Amount', 'Fee (₦)', 'Credit Amount',
+})
+
+
+def run_fee_checks(analyzer):
+    """
+    Run every fee check in FEE_CHECKS and return {result name: table}
+    """
+    return {name: getattr(analyzer, method)() for name, method, _, _ in FEE_CHECKS}
+
+
+def overcharge_totals(results):
+    """
+    Total overcharge in kobo of each check that reports one, from run_fee_checks results
+    """
+    totals = {}
+    for name, _, _, column in FEE_CHECKS:
+        table = results.get(name)
+        if column is None or table is None:
+            continue
+        totals[name] = int(table[column].sum()) if column in table else 0
+    return totals
+
+
+def kobo_to_naira(values):
+    """
+    Convert kobo amounts (a Series or a single total) to naira for display and export
+    """
+    return values / 100
+
+
+def to_naira(table):
+    """
+    Copy of a fee table or totals Series with its money columns in naira
+    """
+    if isinstance(table, pd.Series):
+        return kobo_to_naira(table.astype('Float64'))
+    columns = [column for column in table.columns if column in MONEY_COLUMNS]
+    return table.assign(**{column: kobo_to_naira(table[column].astype('Float64')) for column in columns})
@@ -0,0 +1,112 @@
+import importlib
+import json
+import os
+import re
+
+
+# Modules defining more bank formats, imported after the built-in ones, e.g. "my_banks,other_banks".
+# Each registers its formats with register_bank_format() when imported, so worker processes
+# that import this module get the same registry.
+BANK_FORMAT_PLUGINS = os.environ.get('BANK_APP_BANK_FORMATS', '')
+
+# Statement lines sampled to detect the bank format, about the first page of a PDF
+DETECTION_SAMPLE_LINES = 100
+# Share of all fingerprint hits in the sample that one format needs to be chosen; documents
+# mixing formats more evenly are read with every format
+DETECTION_MIN_SHARE = 0.8
+
+
+class BankFormat:
+    """
+    How one bank writes its statements.
+
+    date_pattern finds a transaction date anywhere in a line; what it matches is parsed with
+    date_format once every character in date_filler is removed (e.g. the stray space in
+    "01-JAN- 24"). fingerprint is a cheap pattern whose hits on a sample of a document tell
+    the bank's statements apart, by default the date pattern itself. columns optionally maps
+    transaction table fields to the header labels of the bank's CSV exports and tabular
+    PDFs, like a csv_profiles.json profile, and is tried before the shared profiles.
+    Patterns are compiled once, when the format is defined.
+    """
+
+    def __init__(self, name, date_pattern, date_format, fingerprint=None, date_filler='', columns=None):
+        self.name = name
+        self.date_pattern = re.compile(f'({date_pattern})')
+        self.date_format = date_format
+        self.fingerprint = re.compile(fingerprint or date_pattern)
+        self.date_filler = date_filler
+        self.columns = columns
+
+    def find_dates(self, texts):
+        """
+        The first date of each text in this format, ready to parse with date_format; NaN where there is none
+        """
+        tokens = texts.str.extract(self.date_pattern, expand=False)
+        for character in self.date_filler:
+            tokens = tokens.str.replace(character, '', regex=False)
+        return tokens
+
+    def score(self, sample):
+        """
+        Number of sample lines the fingerprint matches
+        """
+        return sum(1 for line in sample if isinstance(line, str) and self.fingerprint.search(line))
+
+
+# Registered formats by name, in registration order
+BANK_FORMATS = {}
+
+
+def register_bank_format(bank_format):
+    """
+    Add a format to the registry, or replace the one of the same name.
+    Formats registered earlier win ties when detecting, and take precedence on lines
+    with dates in several formats when none was detected.
+    """
+    BANK_FORMATS[bank_format.name] = bank_format
+    return bank_format
+
+
+def detect_bank_format(sample):
+    """
+    Name of the registered format whose fingerprint matches most lines of sample (e.g. a
+    statement's first page), or None when none matches any or it has less than
+    DETECTION_MIN_SHARE of all the matches
+    """
+    scores = {name: bank_format.score(sample) for name, bank_format in BANK_FORMATS.items()}
+    best = max(scores, key=scores.get, default=None)
+    if best is None or not scores[best] or scores[best] < DETECTION_MIN_SHARE * sum(scores.values()):
+        return None
+    return best
+
+
+def column_profiles(profiles):
+    """
+    Column-mapping profiles with those of the registered formats that have column hints first,
+    each under its format's name
+    """
+    hinted = {name: {'date_format': None, 'columns': bank_format.columns}
+              for name, bank_format in BANK_FORMATS.items() if bank_format.columns}
+    return {**hinted, **{name: profile for name, profile in profiles.items() if name not in hinted}}
+
+
+def registry_fingerprint():
+    """
+    Text describing every registered format, e.g. to key results parsed with them on
+    """
+    return json.dumps([(bank_format.name, bank_format.date_pattern.pattern, bank_format.date_format,
+                        bank_format.fingerprint.pattern, bank_format.date_filler, bank_format.columns)
+                       for bank_format in BANK_FORMATS.values()], sort_keys=True)
+
+
+def load_plugins(modules=BANK_FORMAT_PLUGINS):
+    """
+    Import the modules named in a comma-separated list, which register their formats
+    """
+    for module in filter(None, (name.strip() for name in modules.split(','))):
+        importlib.import_module(module)
+
+
+register_bank_format(BankFormat('Access', r'\d{2}-[A-Z]{3}-\s?\d{2}', '%d-%b-%y', date_filler=' '))  # 01-JAN-24
+register_bank_format(BankFormat('Zenith', r'\d{2}/\d{2}/\d{4}', '%d/%m/%Y'))  # 01/01/2024
+load_plugins()
@@ -0,0 +1,83 @@
+"""
+Check fee checks against small statements with known outcomes.
+
+    python -m benchmarks.fee_cases
+    python -m benchmarks.fee_cases --check eft_transfers
+
+Each case in fee_cases.json is a handful of statement lines, ingested as text, and the rows
+its fee check must return: for each check, the listed columns of every row in order, with
+money in naira and null for a missing value. They pin down decisions that totals alone do
+not show, such as which transfer a charge line is paired with. Exits with status 1 if any
+case differs.
+"""
+import argparse
+import json
+import os
+import sys
+
+from analyzer import FEE_CHECKS, EFTChargeAnalyzer, to_naira
+from instrumentation import configure_logging
+
+
+CASES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fee_cases.json')
+
+CHECK_METHODS = {name: method for name, method, _, _ in FEE_CHECKS}
+
+
+def run_case(check, lines, columns):
+    """
+    Rows of the columns of check's fee table for a statement of lines, as JSON values;
+    no rows when the check returns an empty table
+    """
+    analyzer = EFTChargeAnalyzer(max_workers=1)
+    analyzer.ingest_lines(lines)
+    table = getattr(analyzer, CHECK_METHODS[check])()
+    if table.empty:
+        return []
+    return json.loads(to_naira(table)[columns].to_json(orient='values'))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Check fee checks against statements with known outcomes.")
+    parser.add_argument('--cases', default=CASES_PATH, help="Cases file (default: %(default)s)")
+    parser.add_argument('--check', action='append', choices=list(CHECK_METHODS),
+                        help="Only run the cases of this check; repeat for several (default: all)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging('WARNING')
+
+    with open(args.cases, encoding='utf-8') as file:
+        config = json.load(file)
+
+    failures = 0
+    for check, spec in config['checks'].items():
+        if args.check and check not in args.check:
+            continue
+        columns = spec['columns']
+        print(f"{check}:")
+        for case in spec['cases']:
+            try:
+                rows = run_case(check, case['lines'], columns)
+            except Exception as e:
+                rows = f"{type(e).__name__}: {e}"
+            if rows == case['expected']:
+                print(f"  {case['name']:<40} ok")
+                continue
+            failures += 1
+            print(f"  {case['name']:<40} FAIL")
+            print(f"    columns:  {columns}")
+            print(f"    expected: {case['expected']}")
+            print(f"    got:      {rows}")
+
+    if failures:
+        print(f"{failures} case(s) failed", file=sys.stderr)
+        return 1
+    print("All fee cases passed", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""
+Check the analyzer's memory use against per-stage budgets.
+
+    python -m benchmarks.memory_budget
+    python -m benchmarks.memory_budget --update-budgets
+
+Each input in memory_budgets.json is a fixed-size synthetic statement. It is analyzed
+under tracemalloc, and every stage's peak and retained memory (allocations still held when
+the stage ends) is compared with its budget, as is the memory the analyzer holds once all
+checks have run. Exits with status 1 if any budget is exceeded.
+
+--update-budgets rewrites the budgets from this run's measurements plus HEADROOM, for
+after a change that is meant to use more (or less) memory.
+"""
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import sys
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.run_benchmarks import analyze, statement_path
+from benchmarks.synthetic import BANKS
+from instrumentation import StageRecorder, configure_logging
+
+
+BUDGETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'memory_budgets.json')
+
+# Budgets written by --update-budgets allow this much over the measured use
+HEADROOM = 1.5
+# Stages using less than this are given this budget, so allocator noise does not fail them
+MIN_BUDGET_MB = 0.5
+
+# Pseudo-stage for the memory held by the analyzer after every check has run
+ANALYZER_STAGE = 'analyzer'
+
+# Lines of the warm-up statement analyzed before measuring, so one-off imports and
+# compiled patterns are not charged to the first stage
+WARMUP_LINES = 100
+
+MB = 2 ** 20
+
+
+def measure(file_format, bank, lines, seed=0):
+    """
+    Analyze one synthetic statement under tracemalloc.
+    Returns {stage: {'peak': MB, 'retained': MB}}, including the ANALYZER_STAGE total.
+
+    Run it in a fresh process (see measure_isolated) so that caches filled by earlier
+    statements do not change the result.
+    """
+    path = statement_path(file_format, bank, lines, seed)
+    # The other bank's date format, so the warm-up does not fill the date cache for this one
+    warmup_bank = next(other for other in BANKS if other != bank)
+    analyze(statement_path(file_format, warmup_bank, WARMUP_LINES, seed), file_format)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        with StageRecorder() as recorder:
+            analyzer = analyze(path, file_format)
+        gc.collect()
+        held = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+
+    usage = {}
+    for record in recorder.records:
+        if 'peak_memory_bytes' not in record:
+            # Stages summed over many batches have no peak of their own
+            continue
+        usage[record['stage']] = {
+            'peak': round(record['peak_memory_bytes'] / MB, 3),
+            'retained': round(record['retained_memory_bytes'] / MB, 3),
+        }
+    usage[ANALYZER_STAGE] = {'peak': None, 'retained': round(held / MB, 3)}
+    del analyzer
+    return usage
+
+
+def measure_isolated(file_format, bank, lines, seed=0):
+    """
+    measure() in a newly spawned process
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(measure, file_format, bank, lines, seed).result()
+
+
+def check(usage, budgets):
+    """
+    Compare measured usage with budgets; returns (rows for the report, number of breaches)
+    """
+    rows = []
+    breaches = 0
+    for stage, measured in usage.items():
+        budget = budgets.get(stage)
+        for kind in ('peak', 'retained'):
+            value = measured[kind]
+            limit = budget.get(kind) if budget else None
+            if value is None:
+                continue
+            if limit is None:
+                status = 'no budget'
+            elif value > limit:
+                status = 'OVER'
+                breaches += 1
+            else:
+                status = 'ok'
+            rows.append((stage, kind, value, limit, status))
+    return rows, breaches
+
+
+def updated_budgets(usage):
+    return {
+        stage: {kind: round(max(value * HEADROOM, MIN_BUDGET_MB), 1)
+                for kind, value in measured.items() if value is not None}
+        for stage, measured in usage.items()
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Check analyzer memory use against per-stage budgets.")
+    parser.add_argument('--budgets', default=BUDGETS_PATH, help="Budgets file (default: %(default)s)")
+    parser.add_argument('--update-budgets', action='store_true',
+                        help=f"Rewrite the budgets as this run's usage times {HEADROOM}")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging('WARNING')
+
+    with open(args.budgets, encoding='utf-8') as file:
+        config = json.load(file)
+
+    total_breaches = 0
+    for statement in config['inputs']:
+        label = f"{statement['format']} {statement['bank']} {statement['lines']:,} lines"
+        usage = measure_isolated(statement['format'], statement['bank'], statement['lines'], statement.get('seed', 0))
+        if args.update_budgets:
+            statement['budgets_mb'] = updated_budgets(usage)
+            print(f"Updated budgets for {label}", file=sys.stderr)
+            continue
+
+        rows, breaches = check(usage, statement['budgets_mb'])
+        total_breaches += breaches
+        print(f"{label}:")
+        for stage, kind, value, limit, status in rows:
+            limit = '-' if limit is None else f'{limit:.1f}'
+            print(f"  {stage:<36} {kind:<9} {value:>9.2f} MB  budget {limit:>7} MB  {status}")
+
+    if args.update_budgets:
+        with open(args.budgets, 'w', encoding='utf-8') as file:
+            json.dump(config, file, indent=2)
+            file.write('\n')
+        return 0
+
+    if total_breaches:
+        print(f"{total_breaches} memory budget(s) exceeded", file=sys.stderr)
+        return 1
+    print("All stages within their memory budgets", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,195 @@
+"""
+Time the analyzer on synthetic statements.
+
+    python -m benchmarks.run_benchmarks --sizes 1000 10000 100000 --formats text csv pdf pdf_table
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/<earlier commit>.json
+
+Document ingestion and every find_* check are timed separately, from the analyzer's
+stage records, for each format, bank date format and size. Results are saved as
+benchmarks/results/<commit>.json for comparison across commits.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from analyzer import EFTChargeAnalyzer
+from benchmarks import synthetic
+from instrumentation import StageRecorder, configure_logging, log_stage
+
+
+# pdf is text laid out line by line; pdf_table is the same statement in columns under a header
+FORMATS = ('text', 'csv', 'pdf', 'pdf_table')
+PDF_FORMATS = ('pdf', 'pdf_table')
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+# PDF extraction runs at a few milliseconds per line, so larger PDFs are opt-in
+PDF_MAX_LINES = 10_000
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+# Generated statements are kept here between runs, as generating a large one takes a while
+DATA_DIR = os.environ.get('BANK_APP_BENCHMARK_DATA', os.path.join(tempfile.gettempdir(), 'bank_app_benchmarks'))
+
+WRITERS = {'text': synthetic.write_text, 'csv': synthetic.write_csv, 'pdf': synthetic.write_pdf,
+           'pdf_table': synthetic.write_table_pdf}
+EXTENSIONS = {'text': '.txt', 'csv': '.csv', 'pdf': '.pdf', 'pdf_table': '.table.pdf'}
+
+FIND_METHODS = tuple(sorted(name for name in vars(EFTChargeAnalyzer) if name.startswith('find_')))
+
+
+def statement_path(file_format, bank, size, seed):
+    """
+    Path of a generated statement, generating it on first use
+    """
+    path = os.path.join(DATA_DIR, f'{bank}_{size}_{seed}{EXTENSIONS[file_format]}')
+    if not os.path.exists(path):
+        os.makedirs(DATA_DIR, exist_ok=True)
+        partial = path + '.partial'
+        WRITERS[file_format](partial, size, bank, seed)
+        os.replace(partial, path)
+    return path
+
+
+def analyze(path, file_format):
+    """
+    Ingest one statement and run every find_* check, returning the analyzer
+    """
+    analyzer = EFTChargeAnalyzer()
+    if file_format == 'text':
+        # Text has no upload path; it is parsed the way extracted PDF text is
+        with log_stage('process_document', file_type='text') as stage:
+            with open(path, encoding='utf-8') as file:
+                analyzer.text_data = file.read()
+            stage['rows'] = len(analyzer.transaction_table())
+    else:
+        with open(path, 'rb') as file:
+            analyzer.process_document(file)
+    for name in FIND_METHODS:
+        getattr(analyzer, name)()
+    return analyzer
+
+
+def run_once(path, file_format):
+    """
+    Analyze one statement, returning its stage records
+    """
+    with StageRecorder() as recorder:
+        analyze(path, file_format)
+    return recorder.records
+
+
+def summarize(runs, **labels):
+    """
+    One result per stage: rows and the minimum and median wall and CPU times over the runs
+    """
+    results = []
+    for stage in dict.fromkeys(record['stage'] for record in runs[0]):
+        records = [record for run in runs for record in run if record['stage'] == stage]
+        durations = [record['duration_ms'] for record in records]
+        results.append({
+            **labels,
+            'stage': stage,
+            'rows': records[0].get('rows'),
+            'runs': len(records),
+            'min_ms': min(durations),
+            'median_ms': round(statistics.median(durations), 3),
+            'median_cpu_ms': round(statistics.median(record['cpu_ms'] for record in records), 3),
+        })
+    return results
+
+
+def git_commit():
+    """
+    Short hash of the checked-out commit, suffixed with -dirty if tracked files are modified
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARKS_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BENCHMARKS_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f'{commit}-dirty' if dirty else commit
+
+
+def compare(results, baseline_path):
+    """
+    Print the median time of each stage against a baseline results file
+    """
+    with open(baseline_path, encoding='utf-8') as file:
+        baseline = json.load(file)
+    keys = ['format', 'bank', 'lines', 'stage']
+    current = pd.DataFrame(results)
+    previous = pd.DataFrame(baseline['results'])[keys + ['median_ms']]
+    table = current[keys + ['median_ms']].merge(previous, on=keys, how='left', suffixes=('', '_baseline'))
+    table['ratio'] = (table['median_ms'] / table['median_ms_baseline']).round(2)
+    print(f"Compared with {baseline['commit']}:")
+    print(table.to_string(index=False))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time the analyzer on synthetic statements.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Statement sizes in lines")
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=FORMATS)
+    parser.add_argument('--banks', nargs='+', choices=synthetic.BANKS, default=synthetic.BANKS,
+                        help="Date formats: access (01-JAN-24) and/or zenith (01/01/2024)")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per statement")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--pdf-max-lines', type=int, default=PDF_MAX_LINES,
+                        help="Skip generated PDFs larger than this (default: %(default)s)")
+    parser.add_argument('-o', '--output', help="Results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument('--compare', metavar='RESULTS', help="Earlier results file to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging('WARNING')
+
+    results = []
+    for file_format in args.formats:
+        for size in args.sizes:
+            if file_format in PDF_FORMATS and size > args.pdf_max_lines:
+                print(f"Skipping {size:,}-line PDF (over --pdf-max-lines)", file=sys.stderr)
+                continue
+            for bank in args.banks:
+                path = statement_path(file_format, bank, size, args.seed)
+                runs = [run_once(path, file_format) for _ in range(args.repeat)]
+                results.extend(summarize(runs, format=file_format, bank=bank, lines=size))
+                total = sum(record['duration_ms'] for record in runs[-1]
+                            if record['stage'] == 'process_document' or record['stage'] in FIND_METHODS)
+                print(f"{file_format:>9} {bank:<6} {size:>9,} lines: {total / 1000:.2f}s per run", file=sys.stderr)
+
+    commit = git_commit()
+    output = args.output or os.path.join(RESULTS_DIR, f'{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump({
+            'commit': commit,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeat': args.repeat,
+            'seed': args.seed,
+            'results': results,
+        }, file, indent=2)
+    print(f"Saved {len(results)} results to {output}", file=sys.stderr)
+
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
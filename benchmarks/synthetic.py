@@ -0,0 +1,269 @@
+"""
+Synthetic bank statements for benchmarks.
+
+Statements are generated from a seed, so the same size and bank always give the same
+document. They mix the lines the analyzer looks for (NIP/TRF transfers with their charges,
+stamp duty, SMS alerts, ATM withdrawals, monthly maintenance fees and the other fee
+categories) with ordinary purchases, in the Access (01-JAN-24) or Zenith (01/01/2024) format.
+"""
+import csv
+import random
+from datetime import date, timedelta
+from itertools import islice
+
+
+BANKS = ('access', 'zenith')
+
+NAMES = ('ADA OKAFOR', 'JOHN BELLO', 'AMAKA EZE', 'TUNDE ADEYEMI', 'FATIMA MUSA', 'CHIDI NWOSU')
+MERCHANTS = ('SHOPRITE IKEJA', 'CHICKEN REPUBLIC', 'TOTAL ENERGIES', 'JUMIA', 'BOLT', 'SPAR LEKKI')
+OTHER_FEES = ('OTP charge', 'Card Renewal', 'FX Charges', 'Bill Payment', 'Statement Fee', 'Token Fee')
+
+# Relative frequency of each kind of transaction
+TRANSACTION_WEIGHTS = {
+    'nip_transfer': 20,
+    'trf_transfer': 10,
+    'credit': 15,
+    'sms': 15,
+    'atm': 10,
+    'purchase': 25,
+    'other_fee': 5,
+}
+
+# Statement lines per PDF page
+LINES_PER_PAGE = 60
+
+# Tabular PDFs: column labels with the x position each is drawn from, right-aligned amounts
+# ending at theirs, and the balance the statement opens with
+TABLE_COLUMNS = (('Trans Date', 40), ('Narration', 100), ('Debit', 400), ('Credit', 470), ('Balance', 555))
+OPENING_BALANCE = 1_000_000.00
+# Helvetica glyph widths in thousandths of the font size, for right-aligning amounts
+AMOUNT_GLYPH_WIDTHS = {',': 278, '.': 278, '-': 333}
+DIGIT_GLYPH_WIDTH = 556
+
+# Roughly two years of statement at any size
+STATEMENT_DAYS = 730
+
+
+def transfer_charge(amount):
+    """NIP/TRF charge including VAT, per the current tariff"""
+    if amount < 5000:
+        return 10.75
+    if amount <= 50000:
+        return 26.88
+    return 53.75
+
+
+def format_date(day, bank):
+    if bank == 'access':
+        return day.strftime('%d-%b-%y').upper()
+    return day.strftime('%d/%m/%Y')
+
+
+def statement_records(size, bank='access', seed=0, start=date(2023, 1, 1)):
+    """
+    Yield `size` records of (date, narration, amount, direction, detail) for one statement.
+    detail is text printed after the amount, such as a "Charge: ..." field, or ''.
+    """
+    rng = random.Random(seed)
+    kinds = list(TRANSACTION_WEIGHTS)
+    weights = list(TRANSACTION_WEIGHTS.values())
+    lines_per_day = max(8, size // STATEMENT_DAYS)
+
+    day = start
+    on_day = 0
+    month_debits = 0.0
+    produced = 0
+
+    def records_for(kind):
+        amount = round(rng.lognormvariate(8.5, 1.2), 2)
+        name = rng.choice(NAMES)
+        if kind == 'nip_transfer':
+            charge = transfer_charge(amount)
+            return [(f'NIP TRANSFER TO {name}', amount, 'Debit', f'Charge: {charge:,.2f} '),
+                    ('NIP Charge + VAT', charge, 'Debit', '')]
+        if kind == 'trf_transfer':
+            charge = transfer_charge(amount)
+            return [(f'TRF TO {name} REF {rng.randrange(10 ** 9):09d}', amount, 'Debit', ''),
+                    ('TRF Charge', charge, 'Debit', '')]
+        if kind == 'credit':
+            records = [(f'TRF FROM {name}', amount, 'Credit', '')]
+            if amount >= 10000:
+                records.append(('STAMP DUTY CHARGE', 50.00, 'Debit', ''))
+            return records
+        if kind == 'sms':
+            return [('SMS Charges', 4.00, 'Debit', '')]
+        if kind == 'atm':
+            return [(f'ATM Withdrawal {rng.choice(MERCHANTS)}', round(amount, -3) or 1000.00, 'Debit', '')]
+        if kind == 'purchase':
+            return [(f'POS PURCHASE {rng.choice(MERCHANTS)}', amount, 'Debit', '')]
+        return [(rng.choice(OTHER_FEES), round(rng.uniform(50, 1000), 2), 'Debit', '')]
+
+    while produced < size:
+        if on_day >= lines_per_day:
+            next_day = day + timedelta(days=1)
+            if next_day.month != day.month:
+                # Month end: maintenance fee of 1 per mille of the month's debits
+                fee = round(month_debits * 0.001, 2)
+                yield day, 'ACCOUNT MAINTENANCE FEE', fee, 'Debit', f'Actual Charge: {fee:,.2f} '
+                produced += 1
+                month_debits = 0.0
+            day, on_day = next_day, 0
+            continue
+
+        for narration, amount, direction, detail in records_for(rng.choices(kinds, weights)[0]):
+            if produced >= size:
+                break
+            if direction == 'Debit':
+                month_debits += amount
+            yield day, narration, amount, direction, detail
+            produced += 1
+            on_day += 1
+
+
+def statement_lines(size, bank='access', seed=0):
+    """
+    Yield the text lines of a statement, as extracted from a PDF
+    """
+    for day, narration, amount, direction, detail in statement_records(size, bank, seed):
+        yield f'{format_date(day, bank)} {narration} {amount:,.2f} {detail}{direction}'
+
+
+def write_text(path, size, bank='access', seed=0):
+    with open(path, 'w', encoding='utf-8') as file:
+        for line in statement_lines(size, bank, seed):
+            file.write(line + '\n')
+
+
+def write_csv(path, size, bank='access', seed=0):
+    """
+    Write a structured CSV export with separate debit and credit columns
+    """
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Trans Date', 'Narration', 'Debit', 'Credit'])
+        for day, narration, amount, direction, detail in statement_records(size, bank, seed):
+            debit, credit = (f'{amount:,.2f}', '') if direction == 'Debit' else ('', f'{amount:,.2f}')
+            writer.writerow([format_date(day, bank), f'{narration} {detail}'.strip(), debit, credit])
+
+
+def write_pdf(path, size, bank='access', seed=0, lines_per_page=LINES_PER_PAGE):
+    """
+    Write the statement lines as a minimal text-only PDF, lines_per_page lines per page.
+    Pages are written as they are generated, so large statements are not held in memory.
+    """
+    pages = _paged(statement_lines(size, bank, seed), lines_per_page)
+    _write_pdf_pages(path, (_page_stream(page) for page in pages))
+
+
+def write_table_pdf(path, size, bank='access', seed=0, lines_per_page=LINES_PER_PAGE):
+    """
+    Write the statement as a tabular PDF: date, narration, debit, credit and running balance
+    columns under a header repeated on every page, after an account summary on the first
+    """
+    def rows():
+        balance = OPENING_BALANCE
+        for day, narration, amount, direction, detail in statement_records(size, bank, seed):
+            balance += amount if direction == 'Credit' else -amount
+            debit, credit = (f'{amount:,.2f}', '') if direction == 'Debit' else ('', f'{amount:,.2f}')
+            yield format_date(day, bank), f'{narration} {detail}'.strip(), debit, credit, f'{balance:,.2f}'
+
+    summary = [f'{bank.upper()} BANK STATEMENT OF ACCOUNT',
+               f'Account Name: {NAMES[0]}    Opening Balance: {OPENING_BALANCE:,.2f}']
+    pages = _paged(rows(), lines_per_page)
+    _write_pdf_pages(path, (_table_page_stream(page, summary if number == 0 else [])
+                            for number, page in enumerate(pages)))
+
+
+def _paged(items, per_page):
+    """
+    Split items into lists of per_page, yielding at least one (possibly empty) list
+    """
+    page = list(islice(items, per_page))
+    yield page
+    while len(page) == per_page:
+        page = list(islice(items, per_page))
+        if not page:
+            return
+        yield page
+
+
+def _write_pdf_pages(path, streams):
+    """
+    Write a PDF of one page per content stream, in 9pt Helvetica on A4
+    """
+    with open(path, 'wb') as file:
+        offsets = {}
+
+        def write_object(number, body):
+            offsets[number] = file.tell()
+            file.write(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+
+        file.write(b'%PDF-1.4\n')
+        # Objects 1 and 2 are the font and the page tree, which is written once all pages are known
+        font, tree = 1, 2
+        write_object(font, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+        next_number = 3
+
+        kids = []
+        for stream in streams:
+            write_object(next_number, b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+            write_object(next_number + 1, b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] '
+                                          b'/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>'
+                         % (tree, font, next_number))
+            kids.append(next_number + 1)
+            next_number += 2
+
+        write_object(tree, b'<< /Type /Pages /Kids [%s] /Count %d >>'
+                     % (b' '.join(b'%d 0 R' % kid for kid in kids), len(kids)))
+        catalog = next_number
+        write_object(catalog, b'<< /Type /Catalog /Pages %d 0 R >>' % tree)
+
+        xref = file.tell()
+        file.write(b'xref\n0 %d\n0000000000 65535 f \n' % (catalog + 1))
+        for number in range(1, catalog + 1):
+            file.write(b'%010d 00000 n \n' % offsets[number])
+        file.write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (catalog + 1, catalog, xref))
+
+
+def _page_stream(lines):
+    """
+    Content stream drawing lines top to bottom in 9pt Helvetica
+    """
+    ops = ['BT /F1 9 Tf 11 TL 40 800 Td']
+    for line in lines:
+        escaped = line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+        ops.append(f'({escaped}) Tj T*')
+    ops.append('ET')
+    return '\n'.join(ops).encode('latin-1')
+
+
+def _amount_width(text):
+    """
+    Width in points of an amount drawn in 9pt Helvetica
+    """
+    return sum(AMOUNT_GLYPH_WIDTHS.get(char, DIGIT_GLYPH_WIDTH) for char in text) * 9 / 1000
+
+
+def _table_page_stream(rows, heading):
+    """
+    Content stream drawing heading lines, the column header and rows of cells, one row per 11pt
+    """
+    ops = ['BT /F1 9 Tf']
+    y = 800
+
+    def draw(text, x):
+        escaped = text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+        ops.append(f'1 0 0 1 {x:.2f} {y} Tm ({escaped}) Tj')
+
+    for line in heading:
+        draw(line, 40)
+        y -= 11
+    y -= 11
+    for cells in [[label for label, _ in TABLE_COLUMNS]] + rows:
+        for column, (text, (_, x)) in enumerate(zip(cells, TABLE_COLUMNS)):
+            if text:
+                # Amount columns and their labels are right-aligned at the column's x
+                draw(text, x - _amount_width(text) if column >= 2 else x)
+        y -= 11
+    ops.append('ET')
+    return '\n'.join(ops).encode('latin-1')
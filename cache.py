@@ -0,0 +1,92 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import zlib
+
+
+# Cache location and size budget, overridable from the environment
+DEFAULT_CACHE_DIR = os.environ.get('BANK_APP_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'bank_app'))
+DEFAULT_CACHE_MAX_BYTES = int(os.environ.get('BANK_APP_CACHE_MAX_MB', '512')) * 1024 * 1024
+
+ENTRY_SUFFIX = '.bin'
+
+
+class AnalysisCache:
+    """
+    Content-addressed cache of ingested documents on local disk.
+
+    Entries are keyed by a hash of the uploaded bytes and the parser version, stored as
+    zlib-compressed pickles and evicted least recently used first once the directory
+    grows past max_bytes. Only entries written by this cache are ever read back.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(document_bytes, *version):
+        """
+        Return the cache key for a document's bytes under the given parser version parts
+        """
+        digest = hashlib.sha256(document_bytes)
+        for part in version:
+            digest.update(b'\0' + str(part).encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def get(self, key):
+        """
+        Return the cached value for key, or None on a miss
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                value = pickle.loads(zlib.decompress(file.read()))
+            os.utime(path)  # Mark as recently used
+            return value
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Truncated or stale entry; drop it and treat as a miss
+            self._remove(path)
+            return None
+
+    def put(self, key, value):
+        """
+        Store value under key, then evict old entries to stay within max_bytes
+        """
+        payload = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 6)
+        if len(payload) > self.max_bytes:
+            return
+        # Write to a temporary file first so readers never see a partial entry
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(payload)
+        os.replace(temporary_path, self._path(key))
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(ENTRY_SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
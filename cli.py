@@ -0,0 +1,185 @@
+"""
+Analyze a batch of statements without Streamlit.
+
+    python cli.py statements/ "archive/2024-*.pdf" --output results/ --workers 8
+
+Each statement's fee tables, their totals (totals.csv) and per-stage timings
+(timings.json) are written to <output>/<statement>/, and one row per statement (status,
+timing and overcharge per check) to <output>/summary.csv. Amounts are in naira.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from analyzer import EFTChargeAnalyzer, kobo_to_naira, overcharge_totals, run_fee_checks, to_naira
+from cache import AnalysisCache
+from instrumentation import LOG_LEVEL, StageRecorder, configure_logging
+
+
+STATEMENT_EXTENSIONS = ('.pdf', '.csv')
+
+
+def find_statements(inputs):
+    """
+    Expand directories (searched recursively) and glob patterns into statement paths
+    """
+    paths = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '**', '*')
+        for path in glob.glob(pattern, recursive=True):
+            if os.path.isfile(path) and path.lower().endswith(STATEMENT_EXTENSIONS):
+                paths.append(os.path.abspath(path))
+    return sorted(set(paths))
+
+
+def result_directories(paths, output_dir):
+    """
+    Give each statement its own output directory, named after the file
+    """
+    directories = {}
+    used = set()
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        candidate, suffix = name, 1
+        while candidate in used:
+            suffix += 1
+            candidate = f"{name}_{suffix}"
+        used.add(candidate)
+        directories[path] = os.path.join(output_dir, candidate)
+    return directories
+
+
+def write_table(table, path, file_format):
+    if file_format == 'parquet':
+        table.to_parquet(path + '.parquet')
+    else:
+        table.to_csv(path + '.csv', index=False, float_format='%.2f')
+
+
+def totals_table(totals):
+    """
+    One row per fee table total, in naira: check, label, column and total
+    """
+    return pd.DataFrame(
+        [(name, series.name, column, value) for name, series in totals.items()
+         for column, value in to_naira(series).items()],
+        columns=['check', 'label', 'column', 'total'])
+
+
+def run_statement(statement, use_cache):
+    """
+    Ingest one statement (an open file with a name) and run every fee check, recording stage timings.
+    Returns (analyzer, {result name: fee table} or None when nothing was extracted, StageRecorder).
+    """
+    # Statements already run in parallel, so pages are extracted serially
+    analyzer = EFTChargeAnalyzer(max_workers=1, cache=AnalysisCache() if use_cache else None)
+    with StageRecorder() as recorder:
+        document = analyzer.process_document(statement)
+        results = run_fee_checks(analyzer) if document is not None else None
+    return analyzer, results, recorder
+
+
+def overcharge_summary(analyzer, results):
+    """
+    Lines ingested and overcharge per check and in total, in naira, from run_statement() results
+    """
+    totals = overcharge_totals(results)
+    summary = {'lines': len(analyzer.transactions)}
+    summary.update({f'overcharge_{name}': kobo_to_naira(total) for name, total in totals.items()})
+    summary['total_overcharge'] = kobo_to_naira(sum(totals.values()))
+    return summary
+
+
+def analyze_statement(path, result_dir, file_format, use_cache, log_level=LOG_LEVEL):
+    """
+    Analyze one statement and write its fee tables. Runs in a worker process.
+    """
+    configure_logging(log_level)
+    started = time.perf_counter()
+    summary = {'file': path, 'status': 'ok', 'seconds': 0.0, 'lines': 0, 'error': ''}
+    try:
+        with open(path, 'rb') as statement:
+            analyzer, results, recorder = run_statement(statement, use_cache)
+
+        if results is None:
+            summary['status'] = 'failed'
+            summary['error'] = '; '.join(analyzer.errors) or 'No data extracted'
+        else:
+            os.makedirs(result_dir, exist_ok=True)
+            with open(os.path.join(result_dir, 'timings.json'), 'w', encoding='utf-8') as timings:
+                timings.write(recorder.to_json(file=path))
+            for name, table in results.items():
+                write_table(to_naira(table), os.path.join(result_dir, name), file_format)
+            write_table(totals_table(analyzer.totals), os.path.join(result_dir, 'totals'), file_format)
+            summary.update(overcharge_summary(analyzer, results))
+    except Exception as e:
+        summary['status'] = 'failed'
+        summary['error'] = f"{type(e).__name__}: {e}"
+
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze bank statements for EFT and fee overcharges.")
+    parser.add_argument('inputs', nargs='+', help="Statement directories or glob patterns (PDF or CSV)")
+    parser.add_argument('-o', '--output', required=True, help="Directory for per-statement results and summary")
+    parser.add_argument('-f', '--format', choices=('csv', 'parquet'), default='csv', help="Output file format")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument('--no-cache', action='store_true', help="Do not read or write the extraction cache")
+    parser.add_argument('--log-level', default=LOG_LEVEL, type=str.upper,
+                        choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'),
+                        help="Log level on stderr; INFO logs one timing record per stage (default: %(default)s)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging(args.log_level)
+
+    paths = find_statements(args.inputs)
+    if not paths:
+        print("No PDF or CSV statements found", file=sys.stderr)
+        return 1
+
+    if args.format == 'parquet':
+        try:
+            pd.io.parquet.get_engine('auto')
+        except ImportError as e:
+            print(f"Parquet output needs pyarrow or fastparquet: {e}", file=sys.stderr)
+            return 1
+
+    os.makedirs(args.output, exist_ok=True)
+    directories = result_directories(paths, args.output)
+
+    started = time.perf_counter()
+    summaries = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(analyze_statement, path, directories[path], args.format, not args.no_cache,
+                            args.log_level)
+            for path in paths
+        ]
+        for future in as_completed(futures):
+            summary = future.result()
+            summaries.append(summary)
+            detail = f" - {summary['error']}" if summary['error'] else ''
+            print(f"[{summary['status']}] {summary['file']} ({summary['seconds']:.2f}s){detail}", file=sys.stderr)
+
+    summary_table = pd.DataFrame(summaries).sort_values('file', ignore_index=True)
+    write_table(summary_table, os.path.join(args.output, 'summary'), args.format)
+
+    failures = int((summary_table['status'] != 'ok').sum())
+    print(f"Analyzed {len(paths)} statements in {time.perf_counter() - started:.2f}s, {failures} failed",
+          file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
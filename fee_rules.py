@@ -0,0 +1,110 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Default fee schedule, overridable from the environment so tariff changes need no release
+FEE_SCHEDULE_PATH = os.environ.get(
+    'BANK_APP_FEE_SCHEDULE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fee_schedule.csv'))
+
+SCHEDULE_COLUMNS = ['rule', 'effective_from', 'min_amount', 'charge', 'rate', 'free_per_month']
+
+
+def naira_to_kobo(values):
+    """
+    Convert naira amounts to whole kobo (Int64, NA where missing)
+    """
+    return (pd.to_numeric(pd.Series(values)) * 100).round().astype('Int64')
+
+
+class FeeSchedule:
+    """
+    Effective-dated fee rules evaluated over whole columns of transactions.
+
+    Each rule has one or more periods starting at effective_from, and each period one or
+    more amount tiers starting at min_amount. A transaction is priced by the period in force
+    on its date and the tier its amount falls in, both found with searchsorted.
+
+    The schedule file is in naira; amounts passed in and charges returned are in kobo.
+    """
+
+    def __init__(self, table, version=None):
+        missing = set(SCHEDULE_COLUMNS) - set(table.columns)
+        if missing:
+            raise ValueError(f"Fee schedule is missing columns: {', '.join(sorted(missing))}")
+
+        self.version = version
+        self.table = table.assign(
+            effective_from=pd.to_datetime(table['effective_from']),
+            min_amount=naira_to_kobo(table['min_amount']).fillna(0),
+            charge=naira_to_kobo(table['charge']),
+        ).sort_values(['rule', 'effective_from', 'min_amount'], ignore_index=True)
+
+        # {rule: (period start dates, [tier rows of each period])}
+        self._rules = {}
+        for rule, rows in self.table.groupby('rule', sort=False):
+            periods = [tiers.reset_index(drop=True) for _, tiers in rows.groupby('effective_from')]
+            starts = np.array([tiers['effective_from'].iloc[0] for tiers in periods], dtype='datetime64[ns]')
+            self._rules[rule] = (starts, periods)
+
+    @classmethod
+    def load(cls, path=FEE_SCHEDULE_PATH):
+        """
+        Read a schedule CSV. A leading "# version: ..." comment names the schedule version.
+        """
+        version = None
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                if not line.startswith('#'):
+                    break
+                key, _, value = line.lstrip('#').partition(':')
+                if key.strip().lower() == 'version':
+                    version = value.strip()
+        return cls(pd.read_csv(path, comment='#'), version=version)
+
+    def _periods(self, rule, dates, undated_latest):
+        """
+        Index of the period in force for each date (-1 where none applies)
+        """
+        starts, _ = self._rules[rule]
+        dates = pd.to_datetime(pd.Series(dates)).to_numpy(dtype='datetime64[ns]')
+        undated = np.isnat(dates)
+        positions = np.searchsorted(starts, np.where(undated, starts[0], dates), side='right') - 1
+        positions[undated] = len(starts) - 1 if undated_latest else -1
+        return positions
+
+    def _evaluate(self, rule, field, amounts, dates, undated_latest):
+        if rule not in self._rules:
+            raise KeyError(f"Fee schedule has no rule '{rule}'")
+        _, periods = self._rules[rule]
+        amounts = pd.Series(amounts).astype('Float64').to_numpy(dtype=float, na_value=np.nan)
+        values = np.full(len(amounts), np.nan)
+        positions = self._periods(rule, dates, undated_latest)
+        for position, tiers in enumerate(periods):
+            in_period = positions == position
+            if not in_period.any():
+                continue
+            tier = np.searchsorted(tiers['min_amount'].to_numpy(dtype=float), amounts[in_period], side='right') - 1
+            tier_values = tiers[field].astype('Float64').to_numpy(dtype=float, na_value=np.nan)
+            values[in_period] = np.where(tier >= 0, tier_values[np.clip(tier, 0, None)], np.nan)
+        return values
+
+    def charge(self, rule, amounts, dates, undated_latest=False):
+        """
+        Charge in kobo for each transaction, as an Int64 array; NA where no period applies,
+        or the date is missing and undated_latest is False (with it, undated rows use the latest period)
+        """
+        return pd.array(self._evaluate(rule, 'charge', amounts, dates, undated_latest), dtype='Int64')
+
+    def rate(self, rule, amounts, dates, undated_latest=False):
+        """
+        Proportional rate for each transaction, as for charge()
+        """
+        return self._evaluate(rule, 'rate', amounts, dates, undated_latest)
+
+    def free_per_month(self, rule, dates, undated_latest=False):
+        """
+        Number of free transactions per month in force on each date, as for charge()
+        """
+        return self._evaluate(rule, 'free_per_month', np.zeros(len(dates)), dates, undated_latest)
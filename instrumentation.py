@@ -0,0 +1,234 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+# Logging defaults, overridable from the environment
+LOG_LEVEL = os.environ.get('BANK_APP_LOG_LEVEL', 'WARNING')
+LOG_FORMAT = os.environ.get('BANK_APP_LOG_FORMAT', 'text')  # 'text' or 'json'
+# At DEBUG level, log one in this many ingested lines
+DEBUG_SAMPLE_EVERY = int(os.environ.get('BANK_APP_DEBUG_SAMPLE_EVERY', '1000'))
+
+logger = logging.getLogger('bank_app')
+
+# Callables receiving every stage record, e.g. to feed an external monitoring system
+_stage_listeners = []
+# StageRecorders collecting the records of the run in progress in this thread or task
+_active_recorders = contextvars.ContextVar('bank_app_stage_recorders', default=())
+# Stages in progress that measure peak memory, innermost last
+_memory_stages = contextvars.ContextVar('bank_app_memory_stages', default=())
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Render each record as one JSON object per line, including its stage fields
+    """
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level=None, log_format=None):
+    """
+    Send the app's logs to stderr at the given level ('DEBUG', 'INFO', ...) as text or JSON lines.
+    Safe to call repeatedly, e.g. on every Streamlit rerun.
+    """
+    level = (level or LOG_LEVEL).upper()
+    log_format = log_format or LOG_FORMAT
+
+    handler = next((h for h in logger.handlers if getattr(h, '_bank_app', False)), None)
+    if handler is None:
+        handler = logging.StreamHandler()
+        handler._bank_app = True
+        logger.addHandler(handler)
+        logger.propagate = False
+    if log_format == 'json':
+        handler.setFormatter(StructuredFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    logger.setLevel(level)
+
+
+def add_stage_listener(listener):
+    """
+    Call listener(record) with the fields dict of every stage record, in every thread
+    """
+    _stage_listeners.append(listener)
+
+
+def remove_stage_listener(listener):
+    _stage_listeners.remove(listener)
+
+
+def emit_stage(fields, log=logger):
+    """
+    Log a finished stage's record and pass it to the listeners and active recorders
+    """
+    if log.isEnabledFor(logging.INFO):
+        log.info(' '.join(f'{key}={value}' for key, value in fields.items()), extra={'fields': fields})
+    for listener in list(_stage_listeners):
+        listener(dict(fields))
+    for recorder in _active_recorders.get():
+        recorder.records.append(dict(fields))
+
+
+@contextmanager
+def log_stage(stage, log=logger, **fields):
+    """
+    Time a processing stage and emit one summary record for it when it ends.
+    The caller adds counts to the yielded dict; they become fields of the record.
+
+    Records carry wall time (duration_ms) and CPU time (cpu_ms) and, while tracemalloc
+    is tracing, the stage's peak memory and the memory it left allocated (retained), both
+    relative to what was allocated when it started.
+    """
+    fields = {'stage': stage, **fields}
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        # reset_peak() is global, so carry the enclosing stage's peak so far over to it first
+        current, peak = tracemalloc.get_traced_memory()
+        enclosing = _memory_stages.get()
+        if enclosing:
+            enclosing[-1]['peak'] = max(enclosing[-1]['peak'], peak)
+        tracemalloc.reset_peak()
+        memory = {'start': current, 'peak': current}
+        token = _memory_stages.set(enclosing + (memory,))
+    started, cpu_started = time.perf_counter(), time.process_time()
+    try:
+        yield fields
+    except Exception:
+        fields['status'] = 'error'
+        raise
+    finally:
+        fields['duration_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        fields['cpu_ms'] = round((time.process_time() - cpu_started) * 1000, 3)
+        if tracing and tracemalloc.is_tracing():
+            _memory_stages.reset(token)
+            current, peak = tracemalloc.get_traced_memory()
+            memory['peak'] = max(memory['peak'], peak)
+            enclosing = _memory_stages.get()
+            if enclosing:
+                enclosing[-1]['peak'] = max(enclosing[-1]['peak'], memory['peak'])
+            fields['peak_memory_bytes'] = memory['peak'] - memory['start']
+            fields['retained_memory_bytes'] = current - memory['start']
+        emit_stage(fields, log)
+
+
+class StageTimer:
+    """
+    Time a stage that runs in many short pieces, such as parsing interleaved with streaming
+    extraction. Each `with timer:` block adds to the totals; emit() records them as one stage.
+    """
+
+    def __init__(self, stage, log=logger):
+        self.stage = stage
+        self.log = log
+        self.calls = 0
+        self.seconds = 0.0
+        self.cpu_seconds = 0.0
+
+    def __enter__(self):
+        self._started, self._cpu_started = time.perf_counter(), time.process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds += time.perf_counter() - self._started
+        self.cpu_seconds += time.process_time() - self._cpu_started
+        self.calls += 1
+        return False
+
+    def emit(self, **fields):
+        emit_stage({
+            'stage': self.stage, **fields, 'calls': self.calls,
+            'duration_ms': round(self.seconds * 1000, 3), 'cpu_ms': round(self.cpu_seconds * 1000, 3)
+        }, self.log)
+
+
+def timed_iter(iterable, stage, log=logger, size=None):
+    """
+    Yield from iterable, timing only the time spent producing items, then emit one record
+    whose rows are the number of items, or the sum of size(item)
+    """
+    timer = StageTimer(stage, log)
+    count = 0
+    iterator = iter(iterable)
+    while True:
+        with timer:
+            item = next(iterator, StopIteration)
+        if item is StopIteration:
+            break
+        count += 1 if size is None else size(item)
+        yield item
+    timer.emit(rows=count)
+
+
+class StageRecorder:
+    """
+    Collect the stage records of one run, for display or export.
+
+        with StageRecorder(trace_memory=True) as recorder:
+            analyzer.process_document(statement)
+            run_fee_checks(analyzer)
+        recorder.to_json()
+
+    Records are collected from the thread that entered the recorder (and tasks started
+    from it). trace_memory starts tracemalloc for the run, which slows it noticeably.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.records = []
+        self.started_at = None
+        self._started_tracing = False
+
+    def __enter__(self):
+        self.started_at = time.time()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._token = _active_recorders.set(_active_recorders.get() + (self,))
+        return self
+
+    def __exit__(self, *exc_info):
+        _active_recorders.reset(self._token)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return False
+
+    def to_json(self, **metadata):
+        """
+        The run as a JSON document: its start time, any metadata, and the stage records in order
+        """
+        run = {'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(self.started_at)),
+               **metadata, 'stages': self.records}
+        return json.dumps(run, indent=2, default=str)
+
+
+def logged_stage(method):
+    """
+    Log a method returning a DataFrame as a stage named after it, counting the rows it returns
+    """
+    log = logging.getLogger(f'{logger.name}.{method.__module__}')
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with log_stage(method.__name__, log) as stage:
+            result = method(self, *args, **kwargs)
+            stage['rows'] = len(result)
+        return result
+    return wrapper
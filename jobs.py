@@ -0,0 +1,194 @@
+import contextlib
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from analyzer import FEE_CHECKS, read_document_bytes
+from instrumentation import StageRecorder
+from text_index import StatementText
+
+
+# Threads running requested fee checks side by side
+FEE_CHECK_WORKERS = 4
+
+CHECK_METHODS = {name: method for name, method, _, _ in FEE_CHECKS}
+
+
+def job_key(uploaded_files, *options):
+    """
+    Identify an analysis by the names and contents of its documents and any options
+    """
+    digest = hashlib.sha256()
+    for uploaded_file in uploaded_files:
+        digest.update(uploaded_file.name.encode() + b'\0')
+        digest.update(hashlib.sha256(read_document_bytes(uploaded_file)).digest())
+    for option in options:
+        digest.update(b'\0' + str(option).encode())
+    return digest.hexdigest()
+
+
+class AnalysisJob:
+    """
+    Analysis of uploaded statements running in the background.
+
+    A thread ingests the documents as soon as the job starts. Fee checks are run only when
+    requested, e.g. when their section is opened, on a small thread pool once ingestion is
+    over; each result is kept, so asking again for a check already run costs nothing.
+    Progress, errors and results are kept on the job, so a Streamlit script can show them as
+    they arrive, or pick them up again after a rerun.
+
+        job = AnalysisJob(analyzer, uploaded_files).start()
+        job.request('eft_transfers')
+        version = job.wait()
+        while job.busy:
+            ...  # show job.progress and job.results
+            version = job.wait(version)
+    """
+
+    def __init__(self, analyzer, uploaded_files, trace_memory=False, key=None):
+        self.analyzer = analyzer
+        self.uploaded_files = list(uploaded_files)
+        self.key = key
+        self.recorder = StageRecorder(trace_memory=trace_memory)
+        # (step, done, total) of the ingestion in progress, as passed to the analyzer's progress_handler
+        self.progress = None
+        # Result of process_document(s), and whether ingestion is over
+        self.document_data = None
+        self.ingested = False
+        # Fee tables by FEE_CHECKS result name, in the order their checks finished;
+        # None for a check that failed
+        self.results = {}
+        # Bumped on every change, so wait() callers know there is something new to show
+        self.version = 0
+        self._text = None
+        self._text_lock = threading.Lock()
+        self._requested = []
+        self._running = set()
+        self._changed = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=FEE_CHECK_WORKERS, thread_name_prefix='fee-check')
+        # tracemalloc's figures are process-wide, so with trace_memory recorded work runs one
+        # piece at a time, or each check would reset and read the others' memory
+        self._recording = threading.Lock() if trace_memory else contextlib.nullcontext()
+        analyzer.error_handler = self._notify_error
+        analyzer.progress_handler = self._set_progress
+
+    @property
+    def errors(self):
+        return self.analyzer.errors
+
+    @property
+    def busy(self):
+        """
+        Whether ingestion or any requested check is still running
+        """
+        return not self.ingested or bool(self._running)
+
+    def start(self):
+        """
+        Start ingesting the documents on a daemon thread
+        """
+        threading.Thread(target=self._ingest, name='analysis-job', daemon=True).start()
+        return self
+
+    def request(self, name):
+        """
+        Ask for the fee check with this FEE_CHECKS result name, if it has not been asked for yet.
+        Checks requested during ingestion start once it is over.
+        """
+        with self._changed:
+            if name in self._requested:
+                return
+            self._requested.append(name)
+            if self.ingested:
+                self._submit(name)
+
+    def text(self):
+        """
+        StatementText of the ingested lines, kept for the job once ingestion is over
+        """
+        with self._text_lock:
+            if self._text is None:
+                self._text = StatementText(self.analyzer.transaction_table())
+            return self._text
+
+    def search(self, query):
+        """
+        text().search(query), with the stage building the search index on the first search
+        recorded among the job's
+        """
+        return self._record(lambda: self.text().search(query))
+
+    def close(self):
+        """
+        Drop checks that have not started yet; ones already running finish in the background
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def wait(self, seen_version=None, timeout=None):
+        """
+        Block until the job has changed since seen_version (or is idle), then return its version
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != seen_version or not self.busy, timeout)
+            return self.version
+
+    def _update(self, **changes):
+        with self._changed:
+            for name, value in changes.items():
+                setattr(self, name, value)
+            self.version += 1
+            self._changed.notify_all()
+
+    def _set_progress(self, step, done, total):
+        self._update(progress=(step, done, total))
+
+    def _notify_error(self, message):
+        # The message is already in analyzer.errors
+        self._update()
+
+    def _submit(self, name):
+        # Called holding self._changed
+        self._running.add(name)
+        self._executor.submit(self._check, name)
+
+    def _record(self, function):
+        """
+        Call function under a StageRecorder of its own and add its stage records to the job's,
+        for work done after ingestion, outside the job's recorder
+        """
+        with self._recording, StageRecorder(trace_memory=self.recorder.trace_memory) as recorder:
+            result = function()
+        self.recorder.records.extend(recorder.records)
+        return result
+
+    def _ingest(self):
+        document_data = None
+        try:
+            with self.recorder:
+                if len(self.uploaded_files) == 1:
+                    document_data = self.analyzer.process_document(self.uploaded_files[0])
+                else:
+                    document_data = self.analyzer.process_documents(self.uploaded_files)
+        except Exception as e:
+            self.analyzer.report_error(f"Analysis failed: {e}")
+        finally:
+            with self._changed:
+                self.document_data = document_data
+                self.ingested = True
+                for name in self._requested:
+                    self._submit(name)
+                self.version += 1
+                self._changed.notify_all()
+
+    def _check(self, name):
+        table = None
+        try:
+            table = self._record(getattr(self.analyzer, CHECK_METHODS[name]))
+        except Exception as e:
+            self.analyzer.report_error(f"Fee check {name} failed: {e}")
+        finally:
+            with self._changed:
+                self.results[name] = table
+                self._running.discard(name)
+                self.version += 1
+                self._changed.notify_all()
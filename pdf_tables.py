@@ -0,0 +1,255 @@
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+from pdfminer.layout import LTChar, LTContainer
+
+
+# Words whose tops are within this many points of a row's first word are on that row
+ROW_TOLERANCE = 3
+# Characters further apart than this many points start a new word, as in pdfplumber's extract_words
+WORD_GAP = 3
+# Header words closer than this fraction of their height belong to one label, e.g. "Trans Date"
+HEADER_WORD_GAP = 0.5
+# A row without a date or amount continues the row above it when it starts within this many
+# of its own heights below that row, e.g. a narration wrapped over two lines
+CONTINUATION_GAP = 1.0
+# Pages searched for the column header before a PDF is read as text instead
+HEADER_SEARCH_PAGES = 2
+# Column geometry kept per statement template (see find_column_layout)
+LAYOUT_CACHE_LIMIT = 64
+
+# Mapped fields that hold amounts; a row with none of them and no date is not a transaction
+AMOUNT_FIELDS = ('debit', 'credit', 'amount', 'balance')
+
+logger = logging.getLogger('bank_app.pdf_tables')
+
+_layouts = {}
+_layouts_lock = threading.Lock()
+
+
+class ColumnLayout:
+    """
+    Column geometry of a tabular statement template.
+
+    Columns are named after the header labels, left to right, and split at the x positions in
+    boundaries, so a word belongs to the column its centre falls in. columns maps the
+    transaction table fields to those labels, as resolve_csv_columns does for a CSV header.
+    Layouts are plain data, so they can be passed to worker processes.
+    """
+
+    def __init__(self, headers, boundaries, profile, columns):
+        self.headers = list(headers)
+        self.boundaries = np.asarray(boundaries, dtype='float64')
+        self.profile = profile
+        self.columns = columns
+        self._header_key = tuple(header.lower() for header in self.headers)
+        position = {header: number for number, header in enumerate(self.headers)}
+        self._date_column = position[columns['date']]
+        self._amount_columns = [position[columns[field]] for field in AMOUNT_FIELDS if field in columns]
+
+    def page_rows(self, page):
+        """
+        Rows of cells on a page, one string or None per column. Anything above the column
+        header, where the page repeats it, is dropped, and wrapped lines are joined onto their row.
+        """
+        rows = []
+        previous = None
+        for words in group_rows(page_words(page)):
+            labels = unique_labels([text for text, _, _ in header_cells(words)])
+            if tuple(label.lower() for label in labels) == self._header_key:
+                rows, previous = [], None
+                continue
+            cells = self._cells(words)
+            top, bottom = words[0]['top'], max(word['bottom'] for word in words)
+            if previous is not None and self._continues(cells, top, bottom, previous):
+                self._join(rows[-1], cells)
+            else:
+                rows.append(cells)
+            previous = bottom
+        return rows
+
+    def _cells(self, words):
+        cells = [None] * len(self.headers)
+        centres = np.array([(word['x0'] + word['x1']) / 2 for word in words])
+        for word, column in zip(words, np.searchsorted(self.boundaries, centres)):
+            cells[column] = word['text'] if cells[column] is None else f"{cells[column]} {word['text']}"
+        return cells
+
+    def _continues(self, cells, top, bottom, previous_bottom):
+        if cells[self._date_column] is not None or any(cells[column] is not None for column in self._amount_columns):
+            return False
+        return top - previous_bottom < CONTINUATION_GAP * (bottom - top)
+
+    def _join(self, row, cells):
+        for column, text in enumerate(cells):
+            if text is not None:
+                row[column] = text if row[column] is None else f'{row[column]} {text}'
+
+    def frame(self, rows):
+        """
+        DataFrame of page_rows() rows, with the header labels as columns
+        """
+        return pd.DataFrame(rows, columns=self.headers, dtype=str)
+
+
+def page_chars(layout, height):
+    """
+    (text, x0, x1, top, bottom) of every character in a pdfminer layout, including those in figures
+    """
+    for item in layout:
+        if isinstance(item, LTChar):
+            yield item.get_text(), item.x0, item.x1, height - item.y1, height - item.y0
+        elif isinstance(item, LTContainer):
+            yield from page_chars(item, height)
+
+
+def page_words(page):
+    """
+    Words of a pdfplumber page as {'text', 'x0', 'x1', 'top', 'bottom'} dicts, like extract_words().
+
+    Characters are read straight from the page's pdfminer layout rather than through page.chars,
+    which copies every attribute of every character into a dict; only the text and box are needed.
+    """
+    chars = list(page_chars(page.layout, float(page.height)))
+    if not chars:
+        return []
+    texts, x0, x1, top, bottom = zip(*chars)
+    x0, x1, top, bottom = (np.array(values) for values in (x0, x1, top, bottom))
+    # Characters on one line share a top; a jump of more than ROW_TOLERANCE starts the next line
+    order = np.argsort(top, kind='stable')
+    line = np.empty(len(order), dtype='int64')
+    line[order] = np.cumsum(np.diff(top[order], prepend=top[order[0]]) > ROW_TOLERANCE)
+    order = np.lexsort((x0, line))
+
+    texts = np.array(texts, dtype=object)[order]
+    x0, x1, top, bottom, line = x0[order], x1[order], top[order], bottom[order], line[order]
+    blank = np.char.isspace(texts.astype(str))
+    starts = np.ones(len(order), dtype=bool)
+    starts[1:] = (line[1:] != line[:-1]) | (x0[1:] - x1[:-1] > WORD_GAP) | blank[:-1]
+    word = np.cumsum(starts & ~blank) - 1
+    keep = ~blank
+
+    words = []
+    bounds = np.flatnonzero(np.diff(word[keep], prepend=-1))
+    kept_texts, kept_x0, kept_x1 = texts[keep], x0[keep], x1[keep]
+    kept_top, kept_bottom = top[keep], bottom[keep]
+    for first, last in zip(bounds, np.append(bounds[1:], len(kept_texts))):
+        words.append({'text': ''.join(kept_texts[first:last]), 'x0': kept_x0[first], 'x1': kept_x1[last - 1],
+                      'top': kept_top[first:last].min(), 'bottom': kept_bottom[first:last].max()})
+    return words
+
+
+def group_rows(words):
+    """
+    Group pdfplumber words into rows, top to bottom, each row's words left to right
+    """
+    rows = []
+    for word in sorted(words, key=lambda word: (word['top'], word['x0'])):
+        if rows and word['top'] - rows[-1][0]['top'] <= ROW_TOLERANCE:
+            rows[-1].append(word)
+        else:
+            rows.append([word])
+    for row in rows:
+        row.sort(key=lambda word: word['x0'])
+    return rows
+
+
+def header_cells(words):
+    """
+    Join a row's words into labels of adjacent words: [(label, x0, x1)] left to right
+    """
+    cells = []
+    for word in words:
+        if cells and word['x0'] - cells[-1][2] < HEADER_WORD_GAP * (word['bottom'] - word['top']):
+            text, x0, _ = cells[-1]
+            cells[-1] = (f"{text} {word['text']}", x0, word['x1'])
+        else:
+            cells.append((word['text'], word['x0'], word['x1']))
+    return cells
+
+
+def column_boundaries(cells, body_rows):
+    """
+    x positions splitting the columns of a header.
+
+    Between two neighbouring labels the split is put in the middle of the widest vertical strip
+    that no word of the body crosses, so left-aligned text and right-aligned amounts both stay
+    under their own label. Only rows starting in the first column are used, so centred titles and
+    footers do not cover the gaps. Where no such strip exists, the split is midway between the labels.
+    """
+    first_column_end = cells[1][1]
+    spans = np.array([(word['x0'], word['x1']) for row in body_rows if row[0]['x0'] < first_column_end
+                      for word in row], dtype='float64').reshape(-1, 2)
+    spans = spans[np.argsort(spans[:, 0])]
+    # Uncovered strips between the sorted spans: [covered so far, next span start]
+    covered = np.maximum.accumulate(spans[:, 1])
+    gap_starts, gap_ends = covered[:-1], spans[1:, 0]
+    open_gaps = gap_ends > gap_starts
+
+    boundaries = []
+    for (_, left_x0, left_x1), (_, right_x0, right_x1) in zip(cells, cells[1:]):
+        low, high = (left_x0 + left_x1) / 2, (right_x0 + right_x1) / 2
+        starts = np.maximum(gap_starts[open_gaps], low)
+        ends = np.minimum(gap_ends[open_gaps], high)
+        widths = ends - starts
+        if len(widths) and widths.max() > 0:
+            widest = widths.argmax()
+            boundaries.append((starts[widest] + ends[widest]) / 2)
+        else:
+            boundaries.append((left_x1 + right_x0) / 2)
+    return boundaries
+
+
+def unique_labels(labels):
+    """
+    Header labels with repeats numbered, e.g. "Date", "Date 2", so each names one column
+    """
+    seen = {}
+    unique = []
+    for label in labels:
+        seen[label] = seen.get(label, 0) + 1
+        unique.append(label if seen[label] == 1 else f'{label} {seen[label]}')
+    return unique
+
+
+def find_column_layout(pages, profiles, resolve_columns):
+    """
+    Find the column header on the first of pages that has one and return (ColumnLayout, page index),
+    or (None, None) when no row of any page maps onto a profile.
+
+    resolve_columns(labels, profiles) matches a header against the column-mapping profiles, as
+    for a CSV export. The geometry is cached by template (the header labels and page width), so
+    later statements from the same bank reuse it without measuring the body again.
+    Each page is closed once its words are read.
+    """
+    for page_number, page in enumerate(pages):
+        rows = group_rows(page_words(page))
+        # Only the words are needed from here on
+        page.close()
+        for row_number, row in enumerate(rows):
+            cells = header_cells(row)
+            if len(cells) < 3:
+                continue
+            labels = unique_labels([text for text, _, _ in cells])
+            profile, columns = resolve_columns(labels, profiles)
+            if columns is None:
+                continue
+
+            key = (profile, tuple(label.lower() for label in labels), round(float(page.width)))
+            with _layouts_lock:
+                layout = _layouts.get(key)
+            if layout is not None:
+                logger.debug("Reusing the column layout of %s", labels)
+                return layout, page_number
+
+            cells = [(label, x0, x1) for label, (_, x0, x1) in zip(labels, cells)]
+            layout = ColumnLayout(labels, column_boundaries(cells, rows[row_number + 1:]), profile, columns)
+            with _layouts_lock:
+                if len(_layouts) >= LAYOUT_CACHE_LIMIT:
+                    _layouts.pop(next(iter(_layouts)))
+                _layouts[key] = layout
+            logger.debug("Column layout of %s split at %s", labels, layout.boundaries.round(1).tolist())
+            return layout, page_number
+    return None, None
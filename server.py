@@ -0,0 +1,340 @@
+"""
+Analyze statements over HTTP, for systems that submit them programmatically.
+
+    python server.py --port 8080 --workers 4 --queue 8
+    curl --data-binary @statement.pdf "http://localhost:8080/analyze?name=statement.pdf"
+
+POST /analyze takes one statement as the request body, named by the `name` query parameter
+(or an X-Filename header) so its type is known from the extension. It answers with the
+overcharge per check, the fee table totals and the stage timings as JSON; add `tables=1`
+for the fee tables themselves. Amounts are in naira.
+
+Statements are analyzed on a pool of worker processes through the same parsing code and
+extraction cache as the app and cli.py. At most --workers statements are analyzed at once
+and --queue more wait for a worker; beyond that, requests are turned away at once with 503
+and a Retry-After header instead of piling up.
+
+GET /health reports the queue depth; GET /metrics adds request counts and the latency of
+each stage over the last METRICS_WINDOW analyses.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import TimeoutError
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from analyzer import document_file_type, process_pool, to_naira
+from cli import overcharge_summary, run_statement, totals_table
+from instrumentation import LOG_LEVEL, configure_logging
+
+
+# Largest statement accepted, overridable from the environment
+MAX_UPLOAD_BYTES = int(os.environ.get('BANK_APP_MAX_UPLOAD_MB', '50')) * 1024 * 1024
+# A request waiting longer than this for its analysis is answered with 504
+ANALYSIS_TIMEOUT_SECONDS = 600
+# Suggested wait before retrying a request turned away because the queue was full
+RETRY_AFTER_SECONDS = 5
+# Analyses kept for the per-stage latency figures of /metrics
+METRICS_WINDOW = 1000
+
+logger = logging.getLogger('bank_app.server')
+
+
+def analyze_upload(name, document_bytes, use_cache=True, include_tables=False, log_level=LOG_LEVEL):
+    """
+    Analyze one uploaded statement and return (HTTP status, JSON-ready response).
+    Runs in a worker process.
+    """
+    configure_logging(log_level)
+    started = time.perf_counter()
+    statement = io.BytesIO(document_bytes)
+    statement.name = name
+    analyzer, results, recorder = run_statement(statement, use_cache)
+
+    response = {'file': name, 'status': 'ok', 'errors': analyzer.errors}
+    if results is None:
+        response['status'] = 'failed'
+        status = HTTPStatus.UNPROCESSABLE_ENTITY
+    else:
+        status = HTTPStatus.OK
+        response.update(overcharge_summary(analyzer, results))
+        response['totals'] = json_records(totals_table(analyzer.totals))
+        if include_tables:
+            response['tables'] = {result: json_records(to_naira(table)) for result, table in results.items()}
+    response['stages'] = recorder.records
+    response['seconds'] = round(time.perf_counter() - started, 3)
+    return status, response
+
+
+def json_records(table):
+    """
+    A table as a list of row dicts holding only JSON types: NA as null, dates as ISO strings
+    """
+    return json.loads(table.to_json(orient='records', date_format='iso', default_handler=str))
+
+
+class ServiceMetrics:
+    """
+    Request counts and per-stage latency of the service, shared by its request threads
+    """
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.counts = {'accepted': 0, 'completed': 0, 'failed': 0, 'rejected': 0, 'timed_out': 0}
+        # Durations in milliseconds of each stage over the last `window` analyses
+        self.window = window
+        self.latencies = {}
+        self._lock = threading.Lock()
+
+    def count(self, event):
+        with self._lock:
+            self.counts[event] += 1
+
+    def record(self, stages):
+        """
+        Add the stage records of one analysis, including the pseudo-stages 'request' and 'queue_wait'
+        """
+        with self._lock:
+            for stage in stages:
+                durations = self.latencies.setdefault(stage['stage'], deque(maxlen=self.window))
+                durations.append(stage['duration_ms'])
+
+    def snapshot(self):
+        """
+        Counts, and count, mean, median, 95th percentile and maximum latency in ms per stage
+        """
+        with self._lock:
+            counts = dict(self.counts)
+            latencies = {stage: np.array(durations) for stage, durations in self.latencies.items()}
+        return {
+            'requests': counts,
+            'stage_latency_ms': {
+                stage: {
+                    'count': len(durations),
+                    'mean': round(float(durations.mean()), 3),
+                    'p50': round(float(np.percentile(durations, 50)), 3),
+                    'p95': round(float(np.percentile(durations, 95)), 3),
+                    'max': round(float(durations.max()), 3),
+                }
+                for stage, durations in sorted(latencies.items())
+            },
+        }
+
+
+class AnalysisService:
+    """
+    Bounded pool of worker processes analyzing uploaded statements.
+
+    Up to `workers` statements are analyzed at once and `queue_size` more wait their turn.
+    submit() returns None rather than queue anything further, so callers can push back on
+    their clients while the pool catches up.
+    """
+
+    def __init__(self, workers=None, queue_size=None, use_cache=True, log_level=LOG_LEVEL):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = self.workers * 2 if queue_size is None else queue_size
+        self.use_cache = use_cache
+        self.log_level = log_level
+        self.metrics = ServiceMetrics()
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        # Requests are served from threads, so the workers are spawned (see process_pool)
+        self._executor = process_pool(self.workers)
+
+    @property
+    def capacity(self):
+        return self.workers + self.queue_size
+
+    def depth(self):
+        """
+        (statements being analyzed, statements waiting for a worker)
+        """
+        # Futures are not a reliable guide, since the executor marks a call running as soon as it
+        # is handed towards a worker; every worker is busy before any statement waits
+        with self._pending_lock:
+            in_flight = len(self._pending)
+        running = min(in_flight, self.workers)
+        return running, in_flight - running
+
+    def submit(self, name, document_bytes, include_tables=False):
+        """
+        Queue a statement for analysis; returns its Future, or None when the queue is full
+        """
+        with self._pending_lock:
+            if len(self._pending) >= self.capacity:
+                self.metrics.count('rejected')
+                return None
+            future = self._executor.submit(analyze_upload, name, document_bytes, self.use_cache, include_tables,
+                                           self.log_level)
+            self._pending.add(future)
+        self.metrics.count('accepted')
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future):
+        with self._pending_lock:
+            self._pending.discard(future)
+
+    def health(self):
+        running, waiting = self.depth()
+        return {'status': 'ok', 'workers': self.workers, 'running': running, 'queue_depth': waiting,
+                'queue_capacity': self.queue_size}
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class AnalysisRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /analyze, GET /health and GET /metrics, answered in JSON. The server's `service`
+    attribute is the AnalysisService doing the work.
+    """
+
+    server_version = 'BankAppAnalysis/1.0'
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/health':
+            self.send_json(HTTPStatus.OK, self.service.health())
+        elif path == '/metrics':
+            self.send_json(HTTPStatus.OK, {**self.service.health(), **self.service.metrics.snapshot()})
+        else:
+            self.send_error_json(HTTPStatus.NOT_FOUND, f"No such endpoint: {path}")
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/analyze':
+            self.send_error_json(HTTPStatus.NOT_FOUND, f"No such endpoint: {url.path}")
+            return
+        query = parse_qs(url.query)
+        name = os.path.basename(query.get('name', [self.headers.get('X-Filename', '')])[0])
+        include_tables = query.get('tables', ['0'])[0].lower() in ('1', 'true', 'yes')
+
+        length = self.headers.get('Content-Length')
+        if length is None:
+            self.send_error_json(HTTPStatus.LENGTH_REQUIRED, "Send the statement with a Content-Length")
+            return
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            self.send_error_json(HTTPStatus.BAD_REQUEST, "Content-Length must be a whole number of bytes")
+            return
+        if length > MAX_UPLOAD_BYTES:
+            self.close_connection = True
+            self.send_error_json(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                 f"Statements are limited to {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+            return
+        document_bytes = self.rfile.read(length)
+        if not name:
+            self.send_error_json(HTTPStatus.BAD_REQUEST, "Name the statement with ?name=<file>.pdf or .csv")
+            return
+        if document_file_type(name) is None:
+            self.send_error_json(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, "Unsupported file type. Please upload PDF or CSV.")
+            return
+        if not document_bytes:
+            self.send_error_json(HTTPStatus.BAD_REQUEST, "The statement is empty")
+            return
+
+        started = time.perf_counter()
+        future = self.service.submit(name, document_bytes, include_tables)
+        if future is None:
+            self.send_error_json(HTTPStatus.SERVICE_UNAVAILABLE, "Too many statements queued, retry later",
+                                 headers={'Retry-After': str(RETRY_AFTER_SECONDS)})
+            return
+        try:
+            status, response = future.result(timeout=ANALYSIS_TIMEOUT_SECONDS)
+        except TimeoutError:
+            self.service.metrics.count('timed_out')
+            self.send_error_json(HTTPStatus.GATEWAY_TIMEOUT, "The analysis did not finish in time")
+            return
+        except Exception as e:
+            logger.exception("Analysis of %s failed", name)
+            self.service.metrics.count('failed')
+            self.send_error_json(HTTPStatus.INTERNAL_SERVER_ERROR, f"Analysis failed: {type(e).__name__}: {e}")
+            return
+
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 3)
+        self.service.metrics.count('completed' if status == HTTPStatus.OK else 'failed')
+        self.service.metrics.record(response['stages'] + [
+            {'stage': 'request', 'duration_ms': elapsed_ms},
+            {'stage': 'queue_wait', 'duration_ms': max(elapsed_ms - response['seconds'] * 1000, 0.0)},
+        ])
+        self.send_json(status, response)
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message, headers=None):
+        self.send_json(status, {'status': 'error', 'error': message}, headers)
+
+    def log_message(self, format, *args):
+        logger.info("%s %s", self.address_string(), format % args)
+
+
+def make_server(host, port, service):
+    """
+    A ThreadingHTTPServer answering with AnalysisRequestHandler on top of service
+    """
+    server = ThreadingHTTPServer((host, port), AnalysisRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve statement analysis over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on (default: %(default)s)")
+    parser.add_argument('-p', '--port', type=int, default=8080, help="Port to listen on (default: %(default)s)")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument('-q', '--queue', type=int, default=None,
+                        help="Statements waiting for a worker before requests are turned away (default: 2 per worker)")
+    parser.add_argument('--no-cache', action='store_true', help="Do not read or write the extraction cache")
+    parser.add_argument('--log-level', default=LOG_LEVEL, type=str.upper,
+                        choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'),
+                        help="Log level on stderr; INFO logs each request and stage (default: %(default)s)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging(args.log_level)
+
+    service = AnalysisService(args.workers, args.queue, not args.no_cache, args.log_level)
+    server = make_server(args.host, args.port, service)
+    print(f"Serving on http://{args.host}:{server.server_port} with {service.workers} workers "
+          f"and room for {service.queue_size} queued statements", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import log_stage
+
+
+# Searchable tokens: words, and numbers with their thousands separators and decimals (e.g. 12,000.00)
+TOKEN_PATTERN = r'[a-z0-9]+(?:[.,/-][0-9]+)*'
+
+logger = logging.getLogger('bank_app.text_index')
+
+
+def tokenize(text):
+    """
+    Lower-case search tokens of a query, as they are indexed
+    """
+    return pd.Series([text]).str.lower().str.findall(TOKEN_PATTERN)[0]
+
+
+class StatementText:
+    """
+    Paged, searchable view of a statement's lines.
+
+    Lines are read by position from the transaction table's description column, which is
+    already one row per source line, so a page never joins or copies the whole text.
+    Search goes through an inverted index built from the lines on the first search: the
+    sorted vocabulary of tokens, and for each token the sorted positions of the lines containing it, stored
+    back to back in one array (token i's lines are postings[offsets[i]:offsets[i + 1]]).
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.descriptions = table['description']
+        self.vocabulary = self.offsets = self.postings = None
+        self._index_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.descriptions)
+
+    def _ensure_index(self):
+        with self._index_lock:
+            if self.vocabulary is None:
+                with log_stage('index_text', logger) as stage:
+                    self.vocabulary, self.offsets, self.postings = self._build_index(self.descriptions)
+                    stage['rows'] = len(self.descriptions)
+                    stage['tokens'] = len(self.vocabulary)
+
+    @staticmethod
+    def _build_index(descriptions):
+        tokens = pd.Series(descriptions.to_numpy(), dtype=object).str.lower().str.findall(TOKEN_PATTERN).explode()
+        pairs = pd.DataFrame({'token': tokens.to_numpy(), 'line': tokens.index.to_numpy(dtype='int64')})
+        pairs = pairs.dropna().drop_duplicates().sort_values(['token', 'line'], kind='stable')
+        vocabulary, starts = np.unique(pairs['token'].to_numpy(dtype=object), return_index=True)
+        offsets = np.append(starts, len(pairs)).astype('int64')
+        return vocabulary, offsets, pairs['line'].to_numpy(dtype='int64')
+
+    def lines(self, start, stop):
+        """
+        DataFrame of lines [start, stop) by 0-based position, with their 1-based 'Line' numbers
+        and, for merged statements, the statement and line each came from
+        """
+        start = max(start, 0)
+        return self.lines_at(np.arange(start, max(min(stop, len(self)), start)))
+
+    def lines_at(self, positions):
+        """
+        lines() for the given 0-based positions
+        """
+        window = self.table.iloc[positions]
+        page = pd.DataFrame({'Line': np.asarray(positions, dtype='int64') + 1,
+                             'Text': window['description'].to_numpy()})
+        if 'source' in window:
+            page['Statement'] = window['source'].to_numpy()
+            page['Statement Line'] = window['source_line'].to_numpy() + 1
+        return page
+
+    def _matching(self, term):
+        """
+        Sorted positions of the lines with a token starting with term
+        """
+        first = np.searchsorted(self.vocabulary, term, side='left')
+        last = np.searchsorted(self.vocabulary, term + '\uffff', side='left')
+        if first == last:
+            return np.empty(0, dtype='int64')
+        found = self.postings[self.offsets[first]:self.offsets[last]]
+        return found if last - first == 1 else np.unique(found)
+
+    def search(self, query):
+        """
+        Sorted 0-based positions of the lines containing every term of the query,
+        each matching the start of a token, case-insensitively
+        """
+        terms = tokenize(query)
+        if not terms:
+            return np.empty(0, dtype='int64')
+        self._ensure_index()
+        matches = None
+        for term in sorted(set(terms), key=len, reverse=True):
+            found = self._matching(term)
+            matches = found if matches is None else np.intersect1d(matches, found, assume_unique=True)
+            if not len(matches):
+                break
+        return matches